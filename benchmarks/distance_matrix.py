@@ -0,0 +1,44 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Time distance_matrix on a random numeric column.
+
+Usage: python benchmarks/distance_matrix.py [n_samples] [n_jobs ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import qiime2
+
+from q2_metadata import distance_matrix
+
+
+def main(n_samples=20000, jobs=(1, 2, 4, 8)):
+    values = np.random.RandomState(42).normal(size=n_samples)
+    md = qiime2.NumericMetadataColumn(pd.Series(
+        values, name='value',
+        index=pd.Index(['s%d' % i for i in range(n_samples)], name='id')))
+
+    baseline = None
+    for n_jobs in jobs:
+        start = time.perf_counter()
+        dm = distance_matrix(md, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline, reference = elapsed, dm.condensed_form()
+        assert np.array_equal(dm.condensed_form(), reference)
+        print('n_jobs=%-3d %8.3f s  speedup %.2fx'
+              % (n_jobs, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*args[:1], **({'jobs': args[1:]} if args[1:] else {}))
@@ -12,11 +12,25 @@ import importlib
 # from ._type import MetadataX
 
 from ._tabulate import tabulate
-from ._distance import distance_matrix
+from ._distance import (distance_matrix, euclidean_distance_matrix,
+                        gower_distance_matrix, categorical_distance_matrix,
+                        extend_distance_matrix, batch_distance_matrix,
+                        extract_distance_matrix, geographic_distance_matrix)
+from ._temporal import temporal_distance_matrix
+from ._ordinal import ordinal_distance_matrix
+from ._graph import neighbor_graph, within_group_distances, distance_summary
+from ._ordination import pcoa
+from ._mantel import mantel
 from ._normalize import normalize
 from ._version import get_versions
 
 __version__ = get_versions()['version']
 del get_versions
 
-__all__ = ['tabulate', 'distance_matrix', 'normalize']
\ No newline at end of file
+__all__ = ['tabulate', 'distance_matrix', 'euclidean_distance_matrix',
+           'gower_distance_matrix', 'categorical_distance_matrix',
+           'extend_distance_matrix', 'batch_distance_matrix',
+           'extract_distance_matrix', 'geographic_distance_matrix',
+           'temporal_distance_matrix', 'ordinal_distance_matrix',
+           'neighbor_graph', 'within_group_distances', 'distance_summary',
+           'pcoa', 'mantel', 'normalize']
@@ -0,0 +1,183 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import functools
+import getpass
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+
+# Linux's FICLONE ioctl: the destination shares the source's extents,
+# copy-on-write, on filesystems that support it (btrfs, XFS, ...).
+_FICLONE = 0x40049409
+
+
+def asset_store():
+    """Directory of the shared, content-addressed asset store.
+
+    Set ``Q2_METADATA_ASSET_STORE`` to override the default, a per-user
+    directory next to the temporary directories that visualizations are
+    written to, so that hardlinks into them usually succeed. That default
+    is a predictable path in a shared directory, so it is only used if it
+    is private to the user (see ``_open_store``).
+    """
+    store = os.environ.get('Q2_METADATA_ASSET_STORE')
+    if not store:
+        try:
+            user = getpass.getuser()
+        except (KeyError, OSError):
+            user = 'default'
+        store = os.path.join(tempfile.gettempdir(),
+                             'q2-metadata-assets-%s' % user)
+    return store
+
+
+def _sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _digest(store, path, size, mtime_ns):
+    # Keyed on size and modification time too, so an edited file is
+    # hashed again. An unchanged one is hashed once: its digest is kept in
+    # the (private) store, so later runs read 64 bytes instead of hashing
+    # the whole file.
+    key = hashlib.sha256(('%s\0%d\0%d' % (path, size, mtime_ns)).encode())
+    record = os.path.join(store, '.digest-%s' % key.hexdigest())
+    try:
+        with open(record) as fh:
+            digest = fh.read()
+        if len(digest) == 64:
+            return digest
+    except OSError:
+        pass
+    digest = _sha256(path)
+    _publish(record, lambda fh: fh.write(digest.encode()))
+    return digest
+
+
+def _open_store(store):
+    # Files in the store end up in every visualization, so another user
+    # must not be able to plant or replace them: the store is created
+    # private, and an existing one must belong to this user and not be
+    # writable by anyone else.
+    os.makedirs(store, mode=0o700, exist_ok=True)
+    info = os.stat(store)
+    if not stat.S_ISDIR(info.st_mode):
+        raise OSError('The asset store %s is not a directory.' % store)
+    if os.name == 'posix':
+        if info.st_uid != os.getuid():
+            raise OSError('The asset store %s belongs to another user.'
+                          % store)
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise OSError('The asset store %s is writable by other users.'
+                          % store)
+
+
+def _publish(path, write, mtime_ns=None):
+    # Written under a temporary name and renamed into place, so concurrent
+    # runs never see a partial file.
+    if os.path.exists(path):
+        return
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            write(fh)
+        os.chmod(tmp, 0o644)
+        if mtime_ns is not None:
+            os.utime(tmp, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def stored_asset(src, store=None):
+    """Path of the copy of ``src`` in the store, adding it if needed.
+
+    Files are named by the SHA-256 of their content, and stored with the
+    size and modification time of their source. A stored file that still
+    has both is trusted to match its name, since the store is private
+    (see ``_open_store``); any other is hashed again, and an ``OSError``
+    is raised if its content does not match its name.
+    """
+    if store is None:
+        store = asset_store()
+    _open_store(store)
+    info = os.stat(src)
+    digest = _digest(store, os.path.abspath(src), info.st_size,
+                     info.st_mtime_ns)
+    path = os.path.join(store, '%s-%s' % (digest, os.path.basename(src)))
+
+    def copy(fh):
+        with open(src, 'rb') as source:
+            shutil.copyfileobj(source, fh)
+
+    _publish(path, copy, info.st_mtime_ns)
+    stored = os.lstat(path)
+    if not stat.S_ISREG(stored.st_mode):
+        raise OSError('The stored asset %s is not a regular file.' % path)
+    if (stored.st_size, stored.st_mtime_ns) != (info.st_size,
+                                                info.st_mtime_ns):
+        # Stored from another copy of the same content, e.g. before the
+        # package was reinstalled, or altered since.
+        if _sha256(path) != digest:
+            raise OSError('The stored asset %s does not match its digest.'
+                          % path)
+        os.utime(path, ns=(info.st_mtime_ns, info.st_mtime_ns))
+    return path
+
+
+def _reflink(src, dest):
+    import fcntl
+    with open(src, 'rb') as source, open(dest, 'wb') as target:
+        fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+
+
+def link_or_copy(src, dest):
+    """Hardlink ``src`` to ``dest``, else reflink it, else copy it.
+
+    Returns which of 'hardlink', 'reflink' or 'copy' was used.
+    """
+    try:
+        os.link(src, dest)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        _reflink(src, dest)
+        return 'reflink'
+    except (OSError, ImportError):
+        if os.path.exists(dest):
+            os.remove(dest)
+    shutil.copyfile(src, dest)
+    return 'copy'
+
+
+def install_asset(src, dest):
+    """Place the static asset ``src`` at ``dest`` through the store.
+
+    Repeated installs of the same asset link to one stored copy instead of
+    writing its bytes again. If the store can't be used, or its copy does
+    not match ``src``, ``src`` is copied. No pre-gzipped variants are
+    stored: a visualization's files are read straight from its directory
+    or archive, where nothing would serve them.
+    """
+    try:
+        stored = stored_asset(src)
+    except OSError:
+        shutil.copyfile(src, dest)
+        return 'copy'
+    return link_or_copy(stored, dest)
@@ -6,14 +6,554 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import collections.abc
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import skbio
 import qiime2
 import numpy as np
-import scipy
+import pandas as pd
+import scipy.spatial
+
+
+def _validate_ids(ids):
+    ids = tuple(str(i) for i in ids)
+    if len(set(ids)) != len(ids):
+        raise ValueError("IDs must be unique.")
+    return ids
+
+
+class CondensedDistanceMatrix:
+    """Distance matrix backed by its condensed (upper triangle) vector.
+
+    ``skbio.DistanceMatrix`` always expands its input into a full square
+    array. This class only ever holds the ``n * (n - 1) / 2`` distances,
+    and rows are rebuilt one at a time when the matrix is serialized. It
+    offers the common ``skbio.DistanceMatrix`` accessors (``ids``,
+    ``shape``, ``data``, ``index``, ``filter``, ``to_data_frame`` and
+    indexing by ID or ID pair), and compares equal to an
+    ``skbio.DistanceMatrix`` with the same IDs and distances. ``data`` and
+    ``to_data_frame`` build the full square, as skbio does.
+
+    A matrix built with ``from_row_blocks`` holds no distances at all:
+    blocks of full rows are computed on demand and dropped once written.
+
+    With a ``scale``, the stored values are unsigned integer codes and the
+    distances they stand for are ``code * scale``; every accessor below
+    returns those decoded distances (as float32), while ``dtype`` reports
+    the storage type.
+    """
+
+    def __init__(self, condensed, ids, scale=None):
+        self._ids = _validate_ids(ids)
+        n = len(self._ids)
+        condensed = np.asarray(condensed)
+        if condensed.ndim != 1 or condensed.shape[0] != n * (n - 1) // 2:
+            raise ValueError(
+                "Condensed distances must be a 1-D vector of length "
+                "n * (n - 1) / 2 (%d) for %d IDs, not shape %r."
+                % (n * (n - 1) // 2, n, condensed.shape))
+        self._condensed = condensed
+        self._row_block = None
+        self._block_size = None
+        self._scale = scale
+        self._id_index = None
+
+    @classmethod
+    def from_row_blocks(cls, row_block, ids, block_size, scale=None):
+        """Lazy matrix whose rows come from ``row_block(start, stop)``.
+
+        ``row_block`` must return the ``(stop - start, n)`` array of full
+        rows ``start:stop``; at most ``block_size`` rows are requested at
+        a time, which bounds peak memory by ``block_size * n`` distances.
+        """
+        if block_size < 1:
+            raise ValueError('Block size must be at least one row.')
+        obj = cls.__new__(cls)
+        obj._ids = _validate_ids(ids)
+        obj._condensed = None
+        obj._row_block = row_block
+        obj._block_size = block_size
+        obj._scale = scale
+        obj._id_index = None
+        return obj
+
+    @property
+    def ids(self):
+        return self._ids
+
+    @property
+    def shape(self):
+        return (len(self._ids), len(self._ids))
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @property
+    def dtype(self):
+        if self._condensed is None:
+            return self._row_block(0, min(1, len(self._ids))).dtype
+        return self._condensed.dtype
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __eq__(self, other):
+        if isinstance(other, skbio.DistanceMatrix):
+            return (self.ids == tuple(other.ids) and
+                    np.array_equal(self.redundant_form(), other.data))
+        if self.__class__ != other.__class__:
+            return False
+        return (self.ids == other.ids and
+                np.array_equal(self.condensed_form(), other.condensed_form()))
+
+    @property
+    def data(self):
+        return self.redundant_form()
+
+    def index(self, lookup_id):
+        """Position of ``lookup_id`` among the IDs."""
+        if self._id_index is None:
+            self._id_index = {id_: i for i, id_ in enumerate(self._ids)}
+        try:
+            return self._id_index[lookup_id]
+        except KeyError:
+            raise skbio.stats.distance.MissingIDError(lookup_id)
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.row(self.index(index))
+        if (isinstance(index, tuple) and len(index) == 2 and
+                all(isinstance(i, str) for i in index)):
+            i, j = self.index(index[0]), self.index(index[1])
+            return self.row(i)[j]
+        return self.data[index]
+
+    def filter(self, ids, strict=True):
+        """Matrix of only ``ids``, in that order, as ``skbio`` filters.
+
+        With ``strict=False``, IDs that are not in the matrix are ignored.
+        The result is held in condensed form.
+        """
+        if not strict:
+            known = set(self._ids)
+            ids = [i for i in ids if i in known]
+        positions = np.array([self.index(i) for i in ids], dtype=np.int64)
+        m = len(positions)
+        condensed = np.empty(m * (m - 1) // 2, dtype=self.dtype)
+        offsets = _row_offsets(m, np.arange(m))
+        for k, i in enumerate(positions[:-1]):
+            condensed[offsets[k]:offsets[k] + m - k - 1] = \
+                self._stored_row(i)[positions[k + 1:]]
+        return self.__class__(condensed, ids=ids, scale=self._scale)
+
+    def to_data_frame(self):
+        return pd.DataFrame(self.redundant_form(), index=list(self._ids),
+                            columns=list(self._ids))
+
+    def _decode(self, stored):
+        if self._scale is None:
+            return stored
+        return (stored * self._scale).astype(np.float32)
+
+    def condensed_form(self):
+        if self._condensed is None:
+            n = len(self._ids)
+            return np.concatenate(
+                [rows[np.triu_indices(len(rows), k=start + 1, m=n)]
+                 for start, rows in self.iter_row_blocks()] or
+                [np.empty(0)])
+        return self._decode(self._condensed)
+
+    def redundant_form(self):
+        # Materializes the n x n square; only meant for small matrices.
+        if self._condensed is None:
+            # Each block is copied as it arrives, so row_block callables
+            # may reuse their buffers between calls.
+            square = np.empty((0, 0))
+            for start, rows in self.iter_row_blocks():
+                if start == 0:
+                    square = np.empty(self.shape, dtype=rows.dtype)
+                square[start:start + len(rows)] = rows
+            return square
+        return scipy.spatial.distance.squareform(self.condensed_form(),
+                                                 checks=False)
+
+    def to_skbio(self):
+        return skbio.DistanceMatrix(self.condensed_form(), ids=self._ids)
+
+    def row(self, i):
+        return self._decode(self._stored_row(i))
+
+    def _stored_row(self, i):
+        # Row ``i`` as stored: quantization codes for a scaled matrix.
+        if self._condensed is None:
+            return self._row_block(i, i + 1)[0].copy()
+        n = len(self._ids)
+        row = np.zeros(n, dtype=self._condensed.dtype)
+        # Entries left of the diagonal live in the rows of earlier IDs.
+        j = np.arange(i)
+        row[:i] = self._condensed[j * (2 * n - j - 1) // 2 + i - j - 1]
+        start = i * (2 * n - i - 1) // 2
+        row[i + 1:] = self._condensed[start:start + n - i - 1]
+        return row
+
+    def iter_row_blocks(self):
+        """Yield ``(start, rows)`` pairs covering every row in order."""
+        n = len(self._ids)
+        if self._condensed is None:
+            for start in range(0, n, self._block_size):
+                yield start, self._decode(self._row_block(
+                    start, min(start + self._block_size, n)))
+        else:
+            for i in range(n):
+                yield i, self.row(i)[np.newaxis, :]
+
+    @classmethod
+    def read(cls, fh):
+        """Parse a tab-separated LSMat file, keeping the upper triangle."""
+        ids = fh.readline().rstrip('\n').split('\t')[1:]
+        n = len(ids)
+        condensed = np.empty(n * (n - 1) // 2)
+        offsets = _row_offsets(n, np.arange(n))
+        for i, id_ in enumerate(ids):
+            fields = fh.readline().rstrip('\n').split('\t')
+            if fields[0] != id_ or len(fields) != n + 1:
+                raise ValueError(
+                    "Row %d of the distance matrix does not match its "
+                    "header: expected ID %r followed by %d distances."
+                    % (i + 1, id_, n))
+            condensed[offsets[i]:offsets[i] + n - i - 1] = np.array(
+                fields[i + 2:], dtype=float)
+        return cls(condensed, ids=ids)
+
+    def write(self, fh):
+        # Same layout as skbio's lsmat writer, one block in memory at a time.
+        fh.write('\t'.join([''] + list(self._ids)))
+        fh.write('\n')
+        progress = _Throughput('distance matrix rows')
+        for start, rows in self.iter_row_blocks():
+            for id_, row in zip(self._ids[start:start + len(rows)], rows):
+                fh.write(id_)
+                fh.write('\t')
+                fh.write('\t'.join(np.asarray(row, dtype=str)))
+                fh.write('\n')
+            progress.update(len(rows))
+        progress.finish()
+
+
+class DistanceMatrices(collections.abc.Mapping):
+    """Distance matrices keyed by the metadata column of each, in order.
+
+    A matrix may be given as a callable returning it instead, which is only
+    called, once, when the matrix is first looked up; a batch read from an
+    artifact thus only parses the matrices that are used.
+    """
+
+    def __init__(self, matrices):
+        self._matrices = dict(matrices)
+
+    def __getitem__(self, column):
+        matrix = self._matrices[column]
+        if callable(matrix):
+            matrix = self._matrices[column] = matrix()
+        return matrix
+
+    def __iter__(self):
+        return iter(self._matrices)
+
+    def __len__(self):
+        return len(self._matrices)
+
+
+class _Throughput:
+    """Report items per second to stderr while a long write is running.
+
+    Nothing is printed for jobs that finish within ``interval`` seconds.
+    """
+
+    def __init__(self, label, interval=10.0, stream=None):
+        self.label = label
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.count = 0
+        self._start = self._last = time.monotonic()
+        self._reported = False
+
+    def update(self, count):
+        self.count += count
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._report(now)
+
+    def finish(self):
+        if self._reported:
+            self._report(time.monotonic())
+
+    def _report(self, now):
+        elapsed = max(now - self._start, 1e-9)
+        self._reported = True
+        print('%s: %d written (%.0f/s)'
+              % (self.label, self.count, self.count / elapsed),
+              file=self.stream, flush=True)
+
+
+# Storage types accepted by distance_matrix; unsigned integer types hold
+# quantized codes (see CondensedDistanceMatrix).
+_PRECISIONS = ('float64', 'float32', 'uint16')
+
+# Upper bound on the number of distances held by one kernel block.
+_BLOCK_ELEMENTS = 2 ** 22
+
+# Mean Earth radius (IUGG).
+_EARTH_RADIUS_KM = 6371.0088
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _resolve_n_jobs(n_jobs):
+    if n_jobs < 0:
+        raise ValueError('n_jobs must be zero (one job per CPU) or a '
+                         'positive number of jobs, not %r.' % n_jobs)
+    return n_jobs or os.cpu_count() or 1
+
+
+def _run_tiles(fill, bounds, n_jobs):
+    # NumPy releases the GIL inside ufunc loops, so threads writing into
+    # disjoint slices of one output buffer run in parallel while sharing
+    # the input vector without any copies.
+    tiles = list(zip(bounds[:-1], bounds[1:]))
+    if n_jobs == 1 or len(tiles) < 2:
+        for start, stop in tiles:
+            fill(start, stop)
+        return
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for future in [pool.submit(fill, *tile) for tile in tiles]:
+            future.result()
+
+
+def _row_offsets(n, rows):
+    # Index of the first entry of each row in the condensed vector.
+    rows = np.asarray(rows, dtype=np.int64)
+    return rows * (2 * n - rows - 1) // 2
+
+
+def _triangle_tiles(n, n_tiles):
+    # Row boundaries splitting the upper triangle into tiles holding about
+    # the same number of pairs; rows near the top are the longest.
+    pairs = _row_offsets(n, np.arange(n + 1))
+    targets = np.linspace(0, pairs[-1], n_tiles + 1)
+    bounds = np.searchsorted(pairs, targets)
+    bounds[0], bounds[-1] = 0, n
+    return np.unique(bounds)
+
+
+def _euclidean_into(out, a, b, scale=None):
+    # out[...] = |a - b|, through the same sqrt-of-square arithmetic as
+    # pdist(metric='euclidean'). The distances are computed in float64 and
+    # rounded once into a float32 ``out``, so float32 results are the
+    # float64 ones rounded to nearest, without squares overflowing or
+    # underflowing in float32. With a ``scale``, the distances are
+    # quantized into integer codes instead.
+    if scale is None and out.dtype == np.float64:
+        np.subtract(a, b, out=out)
+        np.multiply(out, out, out=out)
+        np.sqrt(out, out=out)
+    elif scale is None:
+        out[...] = np.sqrt(np.square(np.subtract(a, b)))
+    else:
+        diff = np.abs(np.subtract(a, b))
+        diff /= scale
+        np.rint(diff, out=diff)
+        out[...] = diff
+
+
+def _quantization_scale(values, dtype):
+    # The largest 1-D distance is the spread of the values, which is
+    # mapped onto the largest code.
+    spread = np.ptp(values) if len(values) else 0
+    return spread / np.iinfo(dtype).max if spread > 0 else 1.0
+
+
+def _condensed_euclidean(values, n_jobs, dtype=np.float64, scale=None):
+    n = len(values)
+    out = np.empty(n * (n - 1) // 2, dtype=dtype)
+    offsets = _row_offsets(n, np.arange(n))
+
+    def fill(start, stop):
+        for i in range(start, stop):
+            _euclidean_into(out[offsets[i]:offsets[i] + n - i - 1],
+                            values[i + 1:], values[i], scale)
+
+    # A few tiles per job keeps the pool busy when tiles finish unevenly.
+    _run_tiles(fill, _triangle_tiles(n, 4 * n_jobs), n_jobs)
+    return out
+
+
+def _condensed_from_kernel(kernel, n, n_jobs):
+    """Condensed distances from a blocked pairwise ``kernel``.
+
+    ``kernel(start, stop)`` returns the distances between rows
+    ``start:stop`` and rows ``start + 1:n``. Rows are requested in blocks
+    of about ``_BLOCK_ELEMENTS`` distances so temporaries stay bounded.
+    """
+    out = np.empty(n * (n - 1) // 2)
+    offsets = _row_offsets(n, np.arange(n))
+    rows_per_block = max(1, _BLOCK_ELEMENTS // max(n, 1))
 
+    def fill(start, stop):
+        for lo in range(start, stop, rows_per_block):
+            hi = min(lo + rows_per_block, stop)
+            block = kernel(lo, hi)
+            for i in range(lo, hi):
+                out[offsets[i]:offsets[i] + n - i - 1] = block[i - lo, i - lo:]
 
-def distance_matrix(metadata: qiime2.NumericMetadataColumn)\
-        -> skbio.DistanceMatrix:
+    _run_tiles(fill, _triangle_tiles(n, 4 * n_jobs), n_jobs)
+    return out
+
+
+def _gram_euclidean_kernel(X):
+    # ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab, so each block is one BLAS
+    # matrix product. Centering the columns first (which leaves distances
+    # unchanged) limits the cancellation in the subtraction.
+    X = X - X.mean(axis=0)
+    sq = np.einsum('ij,ij->i', X, X)
+
+    def kernel(start, stop):
+        block = X[start:stop] @ X[start + 1:].T
+        block *= -2
+        block += sq[start:stop, np.newaxis]
+        block += sq[np.newaxis, start + 1:]
+        np.maximum(block, 0, out=block)
+        return np.sqrt(block, out=block)
+    return kernel
+
+
+def _gower_kernel(numeric, codes):
+    # ``numeric`` holds range-scaled values (NaN when missing) and
+    # ``codes`` the factorized categorical values (-1 when missing).
+    # Each column adds its contribution to a whole row block at once;
+    # missing values are left out of both the sum and the column count.
+    n = len(numeric)
+
+    def kernel(start, stop):
+        total = np.zeros((stop - start, n - start - 1))
+        count = np.zeros_like(total)
+        for column in numeric.T:
+            diff = np.abs(np.subtract.outer(column[start:stop],
+                                            column[start + 1:]))
+            present = ~np.isnan(diff)
+            total += np.where(present, diff, 0)
+            count += present
+        for column in codes.T:
+            a = column[start:stop, np.newaxis]
+            b = column[np.newaxis, start + 1:]
+            present = (a >= 0) & (b >= 0)
+            total += (a != b) & present
+            count += present
+        with np.errstate(invalid='ignore'):
+            return total / count
+    return kernel
+
+
+def _haversine_block(latitude, longitude):
+    # Great-circle distances (km) between rows start:stop and rows
+    # columns:n. The haversine term is exactly symmetric in its two
+    # points, so row blocks computed separately still agree.
+    phi, lam = np.radians(latitude), np.radians(longitude)
+    cos_phi = np.cos(phi)
+
+    def block(start, stop, columns):
+        h = np.sin(np.subtract.outer(phi[start:stop], phi[columns:]) / 2)
+        np.multiply(h, h, out=h)
+        s = np.sin(np.subtract.outer(lam[start:stop], lam[columns:]) / 2)
+        np.multiply(s, s, out=s)
+        s *= np.multiply.outer(cos_phi[start:stop], cos_phi[columns:])
+        h += s
+        np.clip(h, 0, 1, out=h)
+        np.sqrt(h, out=h)
+        np.arcsin(h, out=h)
+        h *= 2 * _EARTH_RADIUS_KM
+        return h
+    return block
+
+
+def _mismatch_kernel(codes):
+    def kernel(start, stop):
+        return np.not_equal.outer(codes[start:stop],
+                                  codes[start + 1:]).astype(float)
+    return kernel
+
+
+def _bitset_kernel(bits, n_columns, metric):
+    # Every ID is the set of its (column, value) pairs, one-hot encoded and
+    # packed 8 per byte. The number of shared pairs m is the popcount of
+    # the AND of two bitsets; with no missing values every set has
+    # n_columns members, so both metrics follow from m alone.
+    def kernel(start, stop):
+        shared = np.zeros((stop - start, len(bits) - start - 1),
+                          dtype=np.int32)
+        for word in bits.T:
+            shared += _POPCOUNT[np.bitwise_and.outer(word[start:stop],
+                                                     word[start + 1:])]
+        if metric == 'hamming':
+            return (n_columns - shared) / n_columns
+        return 1 - shared / (2 * n_columns - shared)
+    return kernel
+
+
+def _pair_ids(ids, index):
+    # Inverse of the condensed indexing: the pair of IDs at ``index``.
+    n = len(ids)
+    i = int(np.searchsorted(_row_offsets(n, np.arange(n)), index,
+                            side='right')) - 1
+    return ids[i], ids[index - _row_offsets(n, i) + i + 1]
+
+
+def _scale_columns(X, scaling):
+    if scaling == 'z-score':
+        center, spread = X.mean(axis=0), X.std(axis=0)
+    elif scaling == 'range':
+        center, spread = X.min(axis=0), np.ptp(X, axis=0)
+    elif scaling == 'none':
+        return X
+    else:
+        raise ValueError('Unknown scaling %r.' % scaling)
+    # Constant columns carry no distance information either way; leave
+    # them at zero instead of dividing by zero.
+    spread[spread == 0] = 1
+    return (X - center) / spread
+
+
+def _euclidean_row_block(values, n_jobs=1, dtype=np.float64, scale=None):
+    def row_block(start, stop):
+        rows = np.empty((stop - start, len(values)), dtype=dtype)
+
+        def fill(lo, hi):
+            # sqrt of the square rather than abs() so that every distance
+            # is bit-for-bit what pdist(metric='euclidean') produces.
+            _euclidean_into(rows[lo - start:hi - start],
+                            values[lo:hi, np.newaxis], values, scale)
+
+        bounds = np.linspace(start, stop, min(n_jobs, stop - start) + 1)
+        _run_tiles(fill, np.unique(bounds.astype(int)), n_jobs)
+        return rows
+    return row_block
+
+
+def distance_matrix(metadata: qiime2.NumericMetadataColumn,
+                    block_size: int = None,
+                    n_jobs: int = 1,
+                    precision: str = 'float64') -> CondensedDistanceMatrix:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if precision not in _PRECISIONS:
+        raise ValueError('Unknown precision %r. Choose one of: %s.'
+                         % (precision, ', '.join(_PRECISIONS)))
     if metadata.has_missing_values():
         missing = metadata.get_ids(where_values_missing=True)
         raise ValueError(
@@ -25,6 +565,294 @@ def distance_matrix(metadata: qiime2.NumericMetadataColumn)\
     # "Exploring Microbial Community Diversity"
     # https://github.com/biocore/scikit-bio-cookbook
     series = metadata.to_series()
-    distances = scipy.spatial.distance.pdist(
-        series.values[:, np.newaxis], metric='euclidean')
-    return skbio.DistanceMatrix(distances, ids=series.index)
+    values = series.values.astype(float)
+    dtype = np.dtype(precision)
+    scale = None
+    if dtype.kind == 'u':
+        scale = _quantization_scale(values, dtype)
+    if block_size is not None:
+        # Out-of-core path: rows are computed block by block while the
+        # matrix is written, so memory is bounded by block_size * n.
+        return CondensedDistanceMatrix.from_row_blocks(
+            _euclidean_row_block(values, n_jobs, dtype=dtype, scale=scale),
+            ids=series.index, block_size=block_size, scale=scale)
+    if n_jobs > 1 or dtype != np.float64:
+        # Compact outputs are written straight into their final buffer,
+        # never through a float64 copy of the whole matrix.
+        distances = _condensed_euclidean(values, n_jobs, dtype, scale)
+    else:
+        distances = scipy.spatial.distance.pdist(
+            values[:, np.newaxis], metric='euclidean')
+    return CondensedDistanceMatrix(distances, ids=series.index, scale=scale)
+
+
+def euclidean_distance_matrix(metadata: qiime2.Metadata,
+                              scaling: str = 'none',
+                              n_jobs: int = 1) -> CondensedDistanceMatrix:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    metadata = metadata.filter_columns(column_type='numeric')
+    if metadata.column_count == 0:
+        raise ValueError('The metadata does not contain any numeric '
+                         'columns to compute distances from.')
+    df = metadata.to_dataframe()
+    missing = df.index[df.isnull().any(axis=1)]
+    if len(missing):
+        raise ValueError(
+            "Encountered missing value(s) in the metadata. Computing a "
+            "distance matrix from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    X = _scale_columns(df.values.astype(float), scaling)
+    distances = _condensed_from_kernel(
+        _gram_euclidean_kernel(X), len(df), n_jobs)
+    return CondensedDistanceMatrix(distances, ids=df.index)
+
+
+def gower_distance_matrix(metadata: qiime2.Metadata,
+                          n_jobs: int = 1) -> CondensedDistanceMatrix:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if metadata.column_count == 0:
+        raise ValueError('The metadata does not contain any columns to '
+                         'compute distances from.')
+    df = metadata.to_dataframe()
+    numeric = [name for name, props in metadata.columns.items()
+               if props.type == 'numeric']
+    categorical = [name for name in df.columns if name not in numeric]
+
+    X = df[numeric].values.astype(float)
+    # Columns without any value add nothing to any pair, and have no range.
+    X = X[:, ~np.isnan(X).all(axis=0)]
+    spread = np.nanmax(X, axis=0) - np.nanmin(X, axis=0)
+    spread[~(spread > 0)] = 1
+    X = X / spread
+    # Categories are factorized once; the kernel only compares integers.
+    codes = np.empty((len(df), len(categorical)), dtype=np.int64)
+    for k, name in enumerate(categorical):
+        codes[:, k] = pd.factorize(df[name])[0]
+
+    distances = _condensed_from_kernel(
+        _gower_kernel(X, codes), len(df), n_jobs)
+    undefined = np.flatnonzero(np.isnan(distances))
+    if len(undefined):
+        raise ValueError(
+            "%d pair(s) of IDs do not share any column without missing "
+            "values, so their Gower distance is undefined (e.g. %s and %s)."
+            % ((len(undefined),) + _pair_ids(tuple(df.index), undefined[0])))
+    return CondensedDistanceMatrix(distances, ids=df.index)
+
+
+def categorical_distance_matrix(metadata: qiime2.Metadata,
+                                metric: str = 'hamming',
+                                n_jobs: int = 1) -> CondensedDistanceMatrix:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if metric not in ('hamming', 'jaccard'):
+        raise ValueError('Unknown metric %r.' % metric)
+    metadata = metadata.filter_columns(column_type='categorical')
+    if metadata.column_count == 0:
+        raise ValueError('The metadata does not contain any categorical '
+                         'columns to compute distances from.')
+    df = metadata.to_dataframe()
+    missing = df.index[df.isnull().any(axis=1)]
+    if len(missing):
+        raise ValueError(
+            "Encountered missing value(s) in the metadata. Computing a "
+            "distance matrix from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    # Each column is factorized once; nothing below touches strings.
+    codes = [pd.factorize(df[name])[0] for name in df.columns]
+    if len(codes) == 1:
+        # Same/different group: both metrics reduce to a 0/1 mismatch.
+        kernel = _mismatch_kernel(codes[0])
+    else:
+        onehot = np.zeros((len(df), sum(c.max() + 1 for c in codes)),
+                          dtype=bool)
+        offset = 0
+        for column in codes:
+            onehot[np.arange(len(df)), offset + column] = True
+            offset += column.max() + 1
+        kernel = _bitset_kernel(np.packbits(onehot, axis=1), len(codes),
+                                metric)
+
+    distances = _condensed_from_kernel(kernel, len(df), n_jobs)
+    return CondensedDistanceMatrix(distances, ids=df.index)
+
+
+def _stored_rounding(distances, scale):
+    # (rtol, atol) covering the rounding of stored ``distances``: none in
+    # float64, float32's in float32, and half a code in uint16. A matrix
+    # read back from a file no longer records its precision, so it is
+    # recovered from the distances: uint16 ones lie on a grid of
+    # spread / 65535 (the spread being the largest distance), and float32
+    # ones read back unchanged through the shortest float32 strings that
+    # ``write`` produces.
+    eps = np.finfo(np.float32).eps
+    spread = distances.max()
+    if scale is None and spread > 0:
+        step = spread / np.iinfo(np.uint16).max
+        codes = distances / step
+        # Decoding to float32 moves codes by less than 0.01.
+        if np.all(np.abs(codes - np.rint(codes)) < 0.05):
+            scale = step
+    if scale is not None:
+        return eps, 0.5 * scale * (1 + eps)
+    if distances.dtype == np.float32 or np.array_equal(np.asarray(
+            distances.astype(np.float32), dtype=str).astype(float),
+            distances):
+        return eps, 0.0
+    return 0.0, 0.0
+
+
+def extend_distance_matrix(distance_matrix: CondensedDistanceMatrix,
+                           metadata: qiime2.NumericMetadataColumn) \
+        -> CondensedDistanceMatrix:
+    if metadata.has_missing_values():
+        missing = metadata.get_ids(where_values_missing=True)
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "a distance matrix from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    series = metadata.to_series()
+    series.index = series.index.map(str)
+    old_ids = distance_matrix.ids
+    absent = set(old_ids) - set(series.index)
+    if absent:
+        raise ValueError(
+            "IDs in the distance matrix are missing from the metadata "
+            "column: %s" % ', '.join(sorted(absent)))
+    old_id_set = set(old_ids)
+    new_ids = [i for i in series.index if i not in old_id_set]
+    values = series[list(old_ids) + new_ids].values.astype(float)
+    n, total = len(old_ids), len(values)
+
+    # The old distances are only consistent with the column if every old
+    # value is unchanged up to a shift or reflection. Distances to two
+    # distinct anchors pin each value down in 1-D, so two rows of the old
+    # matrix suffice to check that in O(n).
+    if n > 1:
+        first = distance_matrix.row(0)
+        anchors = [0, int(np.argmax(first))]
+        rows = [first, distance_matrix.row(anchors[1])]
+        rtol, atol = _stored_rounding(np.concatenate(rows),
+                                      distance_matrix.scale)
+        # Shifted values round their differences differently.
+        atol += 4 * np.finfo(np.float64).eps * np.abs(values[:n]).max()
+        for anchor, row in zip(anchors, rows):
+            exp = np.sqrt(np.square(values[:n] - values[anchor]))
+            changed = np.abs(row - exp) > atol + rtol * exp
+            if changed.any():
+                raise ValueError(
+                    "The metadata values of IDs already in the distance "
+                    "matrix have changed (e.g. %s), so the existing "
+                    "distances cannot be reused."
+                    % old_ids[int(np.flatnonzero(changed)[0])])
+
+    full_rows = _euclidean_row_block(values)
+
+    def row_block(start, stop):
+        # Old rows are copied from the existing matrix and only gain the
+        # distances to the new IDs; new rows are computed in full.
+        rows = np.empty((stop - start, total))
+        for i in range(start, min(stop, n)):
+            rows[i - start, :n] = distance_matrix.row(i)
+        if start < n:
+            rows[:n - start, n:] = np.sqrt(np.square(np.subtract.outer(
+                values[start:min(stop, n)], values[n:])))
+        if stop > n:
+            rows[max(n - start, 0):] = full_rows(max(start, n), stop)
+        return rows
+
+    return CondensedDistanceMatrix.from_row_blocks(
+        row_block, ids=list(old_ids) + new_ids,
+        block_size=max(1, _BLOCK_ELEMENTS // max(total, 1)))
+
+
+def batch_distance_matrix(metadata: qiime2.Metadata, columns: list = None,
+                          n_jobs: int = 1) -> DistanceMatrices:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    numeric = metadata.filter_columns(column_type='numeric')
+    if columns is None:
+        columns = list(numeric.columns)
+    unknown = [c for c in columns if c not in numeric.columns]
+    if unknown:
+        raise ValueError('Not numeric metadata columns: %s'
+                         % ', '.join(unknown))
+    if not columns:
+        raise ValueError('The metadata does not contain any numeric '
+                         'columns to compute distances from.')
+
+    # IDs are validated and values extracted once for all columns.
+    df = numeric.to_dataframe()[columns]
+    missing = [c for c in columns if df[c].isnull().any()]
+    if missing:
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column(s) %s. "
+            "Computing a distance matrix from missing values is not "
+            "supported." % ', '.join(missing))
+    ids = _validate_ids(df.index)
+    values = df.values.astype(float).T
+
+    # Every block is a fresh array, dropped once it is written. Matrices
+    # are written one after the other, so only one block is alive at a
+    # time, yet blocks stay valid however the matrices are read.
+    block_size = max(1, _BLOCK_ELEMENTS // max(len(ids), 1))
+    return DistanceMatrices(
+        (column, CondensedDistanceMatrix.from_row_blocks(
+            _euclidean_row_block(column_values, n_jobs),
+            ids=ids, block_size=block_size))
+        for column, column_values in zip(columns, values))
+
+
+def extract_distance_matrix(distance_matrices: DistanceMatrices,
+                            column: str) -> CondensedDistanceMatrix:
+    if column not in distance_matrices:
+        raise ValueError('There is no distance matrix for the column %r. '
+                         'Columns with a distance matrix: %s.'
+                         % (column, ', '.join(distance_matrices)))
+    return distance_matrices[column]
+
+
+def geographic_distance_matrix(latitude: qiime2.NumericMetadataColumn,
+                               longitude: qiime2.NumericMetadataColumn,
+                               block_size: int = None,
+                               n_jobs: int = 1) -> CondensedDistanceMatrix:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    for column in (latitude, longitude):
+        if column.has_missing_values():
+            missing = column.get_ids(where_values_missing=True)
+            raise ValueError(
+                "Encountered missing value(s) in the metadata column %r. "
+                "Computing a distance matrix from missing values is not "
+                "supported. IDs with missing values: %s"
+                % (column.name, ', '.join(sorted(missing))))
+
+    lat = latitude.to_series()
+    lon = longitude.to_series()
+    if set(lat.index) != set(lon.index):
+        raise ValueError('The latitude and longitude columns must contain '
+                         'the same IDs.')
+    lon = lon[lat.index]
+    if ((lat < -90) | (lat > 90)).any():
+        raise ValueError('Latitudes must be between -90 and 90 degrees.')
+    if ((lon < -180) | (lon > 360)).any():
+        raise ValueError('Longitudes must be between -180 and 360 degrees.')
+
+    block = _haversine_block(lat.values.astype(float),
+                             lon.values.astype(float))
+    if block_size is not None:
+        def row_block(start, stop):
+            rows = np.empty((stop - start, len(lat)))
+
+            def fill(lo, hi):
+                rows[lo - start:hi - start] = block(lo, hi, 0)
+
+            bounds = np.linspace(start, stop, min(n_jobs, stop - start) + 1)
+            _run_tiles(fill, np.unique(bounds.astype(int)), n_jobs)
+            return rows
+
+        return CondensedDistanceMatrix.from_row_blocks(
+            row_block, ids=lat.index, block_size=block_size)
+    distances = _condensed_from_kernel(
+        lambda start, stop: block(start, stop, start + 1), len(lat), n_jobs)
+    return CondensedDistanceMatrix(distances, ids=lat.index)
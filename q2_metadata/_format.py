@@ -7,6 +7,7 @@
 # ----------------------------------------------------------------------------
 
 import qiime2.plugin.model as model
+from q2_types.distance_matrix import LSMatFormat
 
 
 class MetadataFormat(model.TextFileFormat):
@@ -14,4 +15,39 @@ class MetadataFormat(model.TextFileFormat):
         return True
 
 MetadataDirectoryFormat = model.SingleFileDirectoryFormat(
-    'MetadataDirectoryFormat', 'metadata.tsv', MetadataFormat)
\ No newline at end of file
+    'MetadataDirectoryFormat', 'metadata.tsv', MetadataFormat)
+
+
+class DistanceGraphFormat(model.TextFileFormat):
+    """Tab-separated edge list: one (id1, id2, distance) row per edge.
+
+    Edges are directed: the rows with a given ``id1`` list its neighbours,
+    so a symmetric relation lists both directions.
+    """
+    HEADER = ['id1', 'id2', 'distance']
+
+    def sniff(self):
+        with self.open() as fh:
+            return fh.readline().rstrip('\n').split('\t') == self.HEADER
+
+
+DistanceGraphDirectoryFormat = model.SingleFileDirectoryFormat(
+    'DistanceGraphDirectoryFormat', 'graph.tsv', DistanceGraphFormat)
+
+
+class ColumnNamesFormat(model.TextFileFormat):
+    """One metadata column name per line."""
+    def sniff(self):
+        return True
+
+
+class DistanceMatrixBatchDirectoryFormat(model.DirectoryFormat):
+    # Column names may not be valid file names, so matrices are numbered
+    # and ``columns.txt`` lists the column of each, in order.
+    columns = model.File('columns.txt', format=ColumnNamesFormat)
+    matrices = model.FileCollection(r'distance-matrix-\d+\.tsv',
+                                    format=LSMatFormat)
+
+    @matrices.set_path_maker
+    def matrices_path_maker(self, index):
+        return 'distance-matrix-%d.tsv' % index
@@ -0,0 +1,212 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import qiime2
+import numpy as np
+import pandas as pd
+
+from ._distance import _resolve_n_jobs, _run_tiles
+
+
+def _edges(ids, order, source, target, distance):
+    # ``source``/``target`` are positions in sorted order; rows are grouped
+    # by source ID in the original ID order.
+    source, target = order[source], order[target]
+    keep = np.lexsort((distance, source))
+    return pd.DataFrame({'id1': ids[source[keep]],
+                         'id2': ids[target[keep]],
+                         'distance': distance[keep]},
+                        columns=['id1', 'id2', 'distance'])
+
+
+def _knn(values, k):
+    # The k nearest neighbours of a value are among the k sorted values on
+    # either side of it, so only an (n, 2k) window is ever compared.
+    n = len(values)
+    offsets = np.concatenate([np.arange(-k, 0), np.arange(1, k + 1)])
+    candidates = np.arange(n)[:, np.newaxis] + offsets
+    valid = (candidates >= 0) & (candidates < n)
+    candidates = np.clip(candidates, 0, n - 1)
+    distance = np.sqrt(np.square(values[candidates] -
+                                 values[:, np.newaxis]))
+    distance[~valid] = np.inf
+    nearest = np.argsort(distance, axis=1, kind='stable')[:, :k]
+    source = np.repeat(np.arange(n), k)
+    target = np.take_along_axis(candidates, nearest, axis=1).ravel()
+    return source, target, np.take_along_axis(distance, nearest,
+                                              axis=1).ravel()
+
+
+def _radius(values, radius):
+    # Neighbours within the radius form one contiguous run of the sorted
+    # values, found with two binary searches per value.
+    n = len(values)
+    lo = np.searchsorted(values, values - radius, side='left')
+    hi = np.searchsorted(values, values + radius, side='right')
+    counts = hi - lo
+    source = np.repeat(np.arange(n), counts)
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    target = np.arange(len(source)) + starts
+    distance = np.sqrt(np.square(values[target] - values[source]))
+    keep = (source != target) & (distance <= radius)
+    return source[keep], target[keep], distance[keep]
+
+
+def neighbor_graph(metadata: qiime2.NumericMetadataColumn, k: int = None,
+                   radius: float = None) -> pd.DataFrame:
+    if (k is None) == (radius is None):
+        raise ValueError('Exactly one of k or radius must be provided.')
+    if metadata.has_missing_values():
+        missing = metadata.get_ids(where_values_missing=True)
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "a neighbor graph from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    series = metadata.to_series()
+    ids = np.asarray(series.index, dtype=object)
+    order = np.argsort(series.values, kind='stable')
+    values = series.values.astype(float)[order]
+
+    if k is not None:
+        if not 1 <= k < len(values):
+            raise ValueError('k must be between 1 and the number of IDs '
+                             'minus one (%d), not %d.'
+                             % (len(values) - 1, k))
+        edges = _knn(values, k)
+    else:
+        if radius < 0:
+            raise ValueError('The radius cannot be negative.')
+        edges = _radius(values, radius)
+    return _edges(ids, order, *edges)
+
+
+def within_group_distances(metadata: qiime2.NumericMetadataColumn,
+                           groups: qiime2.CategoricalMetadataColumn,
+                           n_jobs: int = 1) -> pd.DataFrame:
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if metadata.has_missing_values():
+        missing = metadata.get_ids(where_values_missing=True)
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "distances from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    series = metadata.to_series()
+    grouping = groups.to_series().reindex(series.index)
+    if grouping.isnull().any():
+        raise ValueError(
+            "Every ID in the metadata column must belong to a group. IDs "
+            "without a group: %s"
+            % ', '.join(sorted(grouping.index[grouping.isnull()])))
+
+    # Sorting by group code makes every group a contiguous run, so each
+    # run is one independent block of the (block-diagonal) matrix.
+    codes = pd.factorize(grouping)[0]
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate(
+        [[0], np.flatnonzero(np.diff(codes[order])) + 1, [len(codes)]])
+    sizes = np.diff(bounds)
+    edge_offsets = np.concatenate([[0], np.cumsum(sizes * (sizes - 1))])
+    total = edge_offsets[-1]
+    source = np.empty(total, dtype=np.intp)
+    target = np.empty(total, dtype=np.intp)
+    distance = np.empty(total)
+    values = series.values.astype(float)
+
+    def fill(first, last):
+        for g in range(first, last):
+            members = order[bounds[g]:bounds[g + 1]]
+            size = len(members)
+            off_diagonal = ~np.eye(size, dtype=bool)
+            block = np.subtract.outer(values[members], values[members])
+            out = slice(edge_offsets[g], edge_offsets[g + 1])
+            distance[out] = np.sqrt(np.square(block))[off_diagonal]
+            source[out] = np.repeat(members, size)[off_diagonal.ravel()]
+            target[out] = np.tile(members, size)[off_diagonal.ravel()]
+
+    _run_tiles(fill, np.arange(len(sizes) + 1), n_jobs)
+    return _edges(np.asarray(series.index, dtype=object),
+                  np.arange(len(values)), source, target, distance)
+
+
+def _count_within(values, delta):
+    # For each of the sorted ``values``, the number of others whose
+    # distance to it, values[j] - values[i] as the distance matrix computes
+    # it, is at most ``delta``. Those form a run around i, found by binary
+    # search on values[i] +/- delta; as that sum is rounded, the ends are
+    # then moved, a run of tied values at a time, until the distances
+    # themselves agree.
+    n = len(values)
+    position = np.arange(n)
+    stop = np.searchsorted(values, values + delta, side='right')
+    while True:
+        over = stop > position + 1
+        over[over] = values[stop[over] - 1] - values[over] > delta
+        under = stop < n
+        under[under] = values[stop[under]] - values[under] <= delta
+        if not (over.any() or under.any()):
+            break
+        stop[over] = np.searchsorted(values, values[stop[over] - 1],
+                                     side='left')
+        stop[under] = np.searchsorted(values, values[stop[under]],
+                                      side='right')
+    start = np.searchsorted(values, values - delta, side='left')
+    while True:
+        over = start < position
+        over[over] = values[over] - values[start[over]] > delta
+        under = start > 0
+        under[under] = values[under] - values[start[under] - 1] <= delta
+        if not (over.any() or under.any()):
+            break
+        start[over] = np.searchsorted(values, values[start[over]],
+                                      side='right')
+        start[under] = np.searchsorted(values, values[start[under] - 1],
+                                       side='left')
+    return stop - start - 1
+
+
+def distance_summary(metadata: qiime2.NumericMetadataColumn,
+                     delta: float) -> qiime2.Metadata:
+    if delta < 0:
+        raise ValueError('delta cannot be negative.')
+    if metadata.has_missing_values():
+        missing = metadata.get_ids(where_values_missing=True)
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "distances from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    series = metadata.to_series()
+    n = len(series)
+    if n < 2:
+        raise ValueError('At least two IDs are needed to summarize '
+                         'distances.')
+    order = np.argsort(series.values, kind='stable')
+    raw = series.values.astype(float)[order]
+    # Centering keeps the prefix sums small, so they don't swamp the
+    # differences being accumulated.
+    values = raw - raw[n // 2]
+
+    # In sorted order, the distances from values[i] to everything below it
+    # sum to i * values[i] - prefix[i], and to everything above it to
+    # (prefix[n] - prefix[i + 1]) - (n - i - 1) * values[i].
+    prefix = np.concatenate([[0], np.cumsum(values)])
+    position = np.arange(n)
+    total = (position * values - prefix[:-1] +
+             (prefix[-1] - prefix[1:]) - (n - position - 1) * values)
+    within = _count_within(raw, delta)
+
+    mean_distance = np.empty(n)
+    mean_distance[order] = total / (n - 1)
+    ids_within_delta = np.empty(n, dtype=np.int64)
+    ids_within_delta[order] = within
+    return qiime2.Metadata(pd.DataFrame(
+        {'mean_distance': mean_distance,
+         'ids_within_delta': ids_within_delta},
+        index=series.index, columns=['mean_distance', 'ids_within_delta']))
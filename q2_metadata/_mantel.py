@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import pkg_resources
+from concurrent.futures import ThreadPoolExecutor
+
+import qiime2
+import q2templates
+import numpy as np
+import pandas as pd
+import scipy.stats
+from skbio.util import get_rng
+
+from ._distance import (CondensedDistanceMatrix, _BLOCK_ELEMENTS,
+                        _condensed_euclidean, _resolve_n_jobs, _row_offsets)
+
+
+TEMPLATES = pkg_resources.resource_filename('q2_metadata', 'templates')
+
+
+def _gather(source, n, rows, cols):
+    # Entries (rows[i], cols[j]) of a condensed matrix over ``n`` IDs.
+    # Pairs with rows == cols get an arbitrary in-bounds entry.
+    lo, hi = np.minimum(rows, cols), np.maximum(rows, cols)
+    return source[np.maximum(_row_offsets(n, lo) + hi - lo - 1, 0)]
+
+
+def _upper_blocks(source, n_source, order, rows_per_block):
+    # The upper triangle of ``source`` restricted to and ordered by
+    # ``order``, as row blocks covering columns start + 1:n and zero-padded
+    # left of the diagonal. Multiplying a block of any other pairwise
+    # quantity by these and summing gives its share of the sum over pairs
+    # without ever forming a square matrix.
+    n = len(order)
+    blocks = []
+    for start in range(0, n, rows_per_block):
+        stop = min(start + rows_per_block, n)
+        block = _gather(source, n_source, order[start:stop, np.newaxis],
+                        order[np.newaxis, start + 1:])
+        block[np.tril_indices(stop - start, k=-1, m=n - start - 1)] = 0
+        blocks.append((start, block))
+    return blocks
+
+
+def _mantel_test(distance_matrix, values, ids, method='spearman',
+                 permutations=999, seed=None, n_jobs=1):
+    n_jobs = _resolve_n_jobs(n_jobs)
+    n = len(ids)
+    if n < 3:
+        raise ValueError('At least 3 IDs shared by the distance matrix and '
+                         'the metadata column are required, not %d.' % n)
+    n_pairs = n * (n - 1) // 2
+    position = {id_: i for i, id_ in enumerate(distance_matrix.ids)}
+    order = np.array([position[id_] for id_ in ids], dtype=np.int64)
+    rows_per_block = max(1, _BLOCK_ELEMENTS // n)
+
+    if method == 'pearson':
+        # The metadata distances are regenerated from the values for every
+        # permutation, one row block at a time. Their sum and sum of squares
+        # do not depend on the permutation and follow from the sorted values.
+        y = distance_matrix.condensed_form()
+        centered = values - values.mean()
+        ranked = np.sort(values)
+        x_sum = np.dot(ranked, 2 * np.arange(n) - n + 1)
+        x_square_sum = n * np.dot(centered, centered)
+
+        def x_blocks(permutation):
+            w = values[permutation]
+            for start, block in blocks:
+                yield np.abs(np.subtract.outer(w[start:start + len(block)],
+                                               w[start + 1:]))
+    elif method == 'spearman':
+        # Ranks depend on every distance at once, so the ranked metadata
+        # distances are held once, in condensed form, and only gathered in
+        # permuted order.
+        y = scipy.stats.rankdata(distance_matrix.condensed_form())
+        x = scipy.stats.rankdata(_condensed_euclidean(values, n_jobs))
+        x_sum, x_square_sum = x.sum(), np.dot(x, x)
+
+        def x_blocks(permutation):
+            for start, block in blocks:
+                yield _gather(
+                    x, n, permutation[start:start + len(block), np.newaxis],
+                    permutation[np.newaxis, start + 1:])
+    else:
+        raise ValueError('Unknown method %r.' % method)
+
+    blocks = _upper_blocks(y, len(distance_matrix), order, rows_per_block)
+    del y
+    # Pearson's r only changes through sum(x * (y - mean(y))) under
+    # permutation; centering y inside the blocks keeps the padding at zero.
+    y_mean = sum(block.sum() for _, block in blocks) / n_pairs
+    y_square_sum = 0.0
+    for start, block in blocks:
+        upper = np.triu_indices(len(block), m=block.shape[1])
+        block[upper] -= y_mean
+        y_square_sum += np.dot(block[upper], block[upper])
+    x_norm = np.sqrt(x_square_sum - x_sum ** 2 / n_pairs)
+    y_norm = np.sqrt(y_square_sum)
+
+    def statistic(permutation):
+        cross = sum(np.sum(x_block * block) for x_block, (_, block)
+                    in zip(x_blocks(permutation), blocks))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return cross / (x_norm * y_norm)
+
+    stat = statistic(np.arange(n))
+    if permutations == 0 or np.isnan(stat):
+        return stat, np.nan, n
+
+    # Permutations are drawn in sequence from one generator, as
+    # skbio.stats.distance.mantel draws them, so a seed gives the same
+    # permutations as skbio's Mantel test for any n_jobs. They are evaluated
+    # in parallel a batch at a time.
+    rng = get_rng(seed)
+    permuted = np.empty(permutations)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for first in range(0, permutations, 4 * n_jobs):
+            batch = [rng.permutation(n)
+                     for _ in range(min(4 * n_jobs, permutations - first))]
+            permuted[first:first + len(batch)] = list(
+                pool.map(statistic, batch))
+    count_better = (np.abs(permuted) >= np.abs(stat)).sum()
+    return stat, (count_better + 1) / (permutations + 1), n
+
+
+def mantel(output_dir: str, distance_matrix: CondensedDistanceMatrix,
+           metadata: qiime2.NumericMetadataColumn, method: str = 'spearman',
+           permutations: int = 999, intersect_ids: bool = False,
+           seed: int = None, n_jobs: int = 1) -> None:
+    if metadata.has_missing_values():
+        missing = metadata.get_ids(where_values_missing=True)
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "a Mantel test from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    series = metadata.to_series()
+    series.index = series.index.map(str)
+    in_matrix = set(distance_matrix.ids)
+    ids = [i for i in series.index if i in in_matrix]
+    if not intersect_ids and (len(ids) != len(series) or
+                              len(ids) != len(distance_matrix)):
+        raise ValueError(
+            'The distance matrix and the metadata column do not contain '
+            'the same IDs. Pass intersect_ids to only test the IDs they '
+            'share.')
+
+    stat, p_value, n = _mantel_test(
+        distance_matrix, series[ids].values.astype(float), ids,
+        method=method, permutations=permutations, seed=seed, n_jobs=n_jobs)
+
+    results = pd.Series([method.title(), n, stat, p_value, permutations],
+                        index=['Method', 'Sample size', 'Test statistic',
+                               'p-value', 'Number of permutations'],
+                        name='Mantel test results')
+    results.to_frame().to_csv(os.path.join(output_dir, 'mantel.tsv'),
+                              sep='\t', header=False)
+    index = os.path.join(TEMPLATES, 'mantel', 'index.html')
+    q2templates.render(index, output_dir, context={
+        'metadata_column': metadata.name,
+        'results': q2templates.df_to_html(results.to_frame(), header=False),
+    })
@@ -0,0 +1,60 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import qiime2
+import numpy as np
+import pandas as pd
+import pkg_resources
+
+from ._distance import CondensedDistanceMatrix, distance_matrix
+from .normalization._norm_utils import read_variable_rules
+
+RULES = pkg_resources.resource_filename('q2_metadata', 'normalization/rules')
+
+
+def _rank_codes(series, expected, absent=()):
+    """Encode values by their position in the ``expected`` order.
+
+    Values listed in ``absent`` (the rule's blank and missing values) are
+    reported as missing; any other value outside ``expected`` is an error.
+    """
+    codes = pd.Index(expected).get_indexer(series.values)
+    missing = series.isnull().values | series.isin(absent).values
+    if missing.any():
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "a distance matrix from missing values is not supported. IDs with "
+            "missing values: %s"
+            % ', '.join(sorted(series.index[missing])))
+    if (codes < 0).any():
+        unexpected = pd.unique(series.values[codes < 0])
+        raise ValueError(
+            'The following value(s) are not among the expected values of '
+            'the rule for %r: %s'
+            % (series.name, ', '.join(sorted(map(repr, unexpected)))))
+    return codes.astype(np.int64)
+
+
+def ordinal_distance_matrix(metadata: qiime2.CategoricalMetadataColumn,
+                            rules_dir: str = None,
+                            block_size: int = None,
+                            n_jobs: int = 1) -> CondensedDistanceMatrix:
+    rules = read_variable_rules(rules_dir or RULES, metadata.name)
+    expected = rules.get('expected')
+    if not isinstance(expected, list) or not expected:
+        raise ValueError('The rule for %r does not define an ordered list '
+                         'of expected values.' % metadata.name)
+    expected = [str(value) for value in expected]
+    absent = [str(rules[key]) for key in ('blank', 'missing')
+              if rules.get(key) is not None]
+
+    series = metadata.to_series()
+    codes = _rank_codes(series, expected, absent)
+    column = qiime2.NumericMetadataColumn(
+        pd.Series(codes.astype(float), index=series.index, name=series.name))
+    return distance_matrix(column, block_size=block_size, n_jobs=n_jobs)
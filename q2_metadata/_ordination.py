@@ -0,0 +1,65 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import skbio
+import qiime2
+import numpy as np
+import pandas as pd
+
+from ._distance import _scale_columns
+
+
+def pcoa(metadata: qiime2.Metadata, scaling: str = 'none',
+         number_of_dimensions: int = None) -> skbio.OrdinationResults:
+    metadata = metadata.filter_columns(column_type='numeric')
+    if metadata.column_count == 0:
+        raise ValueError('The metadata does not contain any numeric '
+                         'columns to compute an ordination from.')
+    df = metadata.to_dataframe()
+    missing = df.index[df.isnull().any(axis=1)]
+    if len(missing):
+        raise ValueError(
+            "Encountered missing value(s) in the metadata. Computing an "
+            "ordination from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    # PCoA of Euclidean distances is PCA of the centered values: the
+    # double-centered Gram matrix that PCoA decomposes is X X^T, whose
+    # eigenvectors and eigenvalues come from the thin SVD of X without
+    # ever forming an n x n matrix.
+    X = _scale_columns(df.values.astype(float), scaling)
+    X = X - X.mean(axis=0)
+    U, s, _ = np.linalg.svd(X, full_matrices=False)
+    # Fix the arbitrary sign of each axis so results are reproducible.
+    signs = np.sign(U[np.abs(U).argmax(axis=0), np.arange(U.shape[1])])
+    signs[signs == 0] = 1
+    U *= signs
+
+    eigvals = s ** 2
+    total = eigvals.sum()
+    if number_of_dimensions is not None:
+        if number_of_dimensions > len(eigvals):
+            raise ValueError(
+                'Cannot compute %d dimensions from %d numeric column(s) and '
+                '%d ID(s); at most %d are available.'
+                % (number_of_dimensions, df.shape[1], df.shape[0],
+                   len(eigvals)))
+        U, s = U[:, :number_of_dimensions], s[:number_of_dimensions]
+        eigvals = eigvals[:number_of_dimensions]
+
+    axes = ['PC%d' % (i + 1) for i in range(len(eigvals))]
+    if total > 0:
+        proportion = eigvals / total
+    else:
+        proportion = np.zeros_like(eigvals)
+    return skbio.OrdinationResults(
+        short_method_name='PCoA',
+        long_method_name='Principal Coordinate Analysis',
+        eigvals=pd.Series(eigvals, index=axes),
+        samples=pd.DataFrame(U * s, index=df.index.map(str), columns=axes),
+        proportion_explained=pd.Series(proportion, index=axes))
@@ -6,41 +6,161 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import base64
+import csv
+import gzip
+import json
 import os
 import pkg_resources
-import shutil
 
+import numpy as np
 import pandas as pd
 
 import qiime2
 import q2templates
 
+from ._assets import install_asset
+
 
 TEMPLATES = pkg_resources.resource_filename('q2_metadata', 'templates')
 
+# Rows per data shard. The page only fetches the shards it needs, and only
+# one shard's JSON text is held in memory while they are written.
+_SHARD_ROWS = 10000
+
+# Columns per shard file (counting the ID column). Wider tables split each
+# shard's rows across several files, so the page only fetches the columns
+# on display.
+_GROUP_COLUMNS = 200
+
+# Tables whose shard files add up to at most this many (gzipped) bytes are
+# also carried by the page itself, base64-encoded.
+_INLINE_BYTES = 2 ** 20
+
+
+def _pack(array):
+    return base64.b64encode(array.tobytes()).decode('ascii')
+
+
+def _encode_column(values, numeric, ids=False):
+    """Columnar encoding of one shard's values, decoded by the page.
+
+    IDs are unique, so the ID column is a plain list of them. Numeric
+    columns become packed little-endian float64 arrays (NaN when missing).
+    Other columns are dictionary-encoded: little-endian integer codes, as
+    narrow as the number of distinct values allows, into a table of those
+    values, where code 0 is reserved for missing values.
+    """
+    if ids:
+        return {'ids': list(values)}
+    if numeric:
+        return {'numbers': _pack(np.asarray(values, dtype='<f8'))}
+    codes, uniques = pd.factorize(values)
+    width = next(w for w in (1, 2, 4) if len(uniques) < 2 ** (8 * w))
+    return {'values': [None] + list(uniques), 'width': width,
+            'codes': _pack((codes + 1).astype('<u%d' % width))}
+
+
+def _tsv_cells(values, numeric):
+    # Formatted as qiime2's metadata writer formats them: missing values
+    # are empty, and floats get up to 15 significant digits.
+    if numeric:
+        return ['' if np.isnan(v) else '{0:.15g}'.format(v) for v in values]
+    return [v if isinstance(v, str) else ''
+            for v in np.asarray(values, dtype=object)]
+
+
+def _write_shard(path, columns):
+    payload = json.dumps({'columns': columns}, separators=(',', ':'))
+    # No file name or timestamp in the gzip header, so identical shards
+    # compress to identical bytes.
+    with open(path, 'wb') as raw, \
+            gzip.GzipFile(filename='', mode='wb', fileobj=raw,
+                          compresslevel=6, mtime=0) as fh:
+        fh.write(payload.encode('ascii'))
+
+
+def _write_table(output_dir, metadata, shard_rows, group_columns):
+    """Write ``metadata.tsv`` and the page's data shards in one pass.
+
+    Each chunk of ``shard_rows`` rows is visited once, and emitted both as
+    TSV lines (in the layout of ``Metadata.save``) and as gzipped, columnar
+    JSON shards, one per group of ``group_columns`` columns. Returns the
+    manifest the page uses to find the shards: the column headers and
+    types, the total row count, and each shard's row count and paths (one
+    per column group).
+    """
+    df = metadata.to_dataframe()
+    names = [metadata.id_header] + list(metadata.columns)
+    types = [props.type for props in metadata.columns.values()]
+    numeric = [False] + [t == 'numeric' for t in types]
+    groups = range(0, len(names), group_columns)
+
+    os.mkdir(os.path.join(output_dir, 'data'))
+    shards = []
+    with open(os.path.join(output_dir, 'metadata.tsv'), 'w', newline='',
+              encoding='utf-8') as fh:
+        tsv = csv.writer(fh, dialect='excel-tab', strict=True)
+        tsv.writerow(names)
+        tsv.writerow(['#q2:types'] + types)
+        for start in range(0, len(df), shard_rows):
+            chunk = df.iloc[start:start + shard_rows]
+            columns = [chunk.index.values] + [
+                chunk.iloc[:, i].values for i in range(chunk.shape[1])]
+            tsv.writerows(zip(*[_tsv_cells(values, numeric[i])
+                                for i, values in enumerate(columns)]))
+            paths = []
+            for first in groups:
+                path = 'data/shard-%05d-%03d.json.gz' % (
+                    len(shards), first // group_columns)
+                stop = first + group_columns
+                _write_shard(os.path.join(output_dir, path),
+                             [_encode_column(values, numeric[i], ids=i == 0)
+                              for i, values in enumerate(columns[first:stop],
+                                                         first)])
+                paths.append(path)
+            shards.append({'paths': paths, 'rows': len(chunk)})
+    return {'columns': [[n, t] for n, t in zip(names, [''] + types)],
+            'rows': len(df), 'shard_rows': shard_rows,
+            'group_columns': group_columns, 'shards': shards}
+
+
+def _inline_shards(output_dir, manifest, limit):
+    # Browsers refuse to fetch the shard files of a page opened straight
+    # from disk (file://), so small tables are also put in the manifest;
+    # larger ones can only be viewed where the files can be fetched.
+    paths = [path for shard in manifest['shards'] for path in shard['paths']]
+    if sum(os.path.getsize(os.path.join(output_dir, path))
+           for path in paths) > limit:
+        return
+    inline = {}
+    for path in paths:
+        with open(os.path.join(output_dir, path), 'rb') as fh:
+            inline[path] = base64.b64encode(fh.read()).decode('ascii')
+    manifest['inline'] = inline
+
 
 def tabulate(output_dir: str, input: qiime2.Metadata,
              page_size: int = 100) -> None:
     if page_size < 1:
         raise ValueError('Cannot render less than one record per page.')
 
-    df = input.to_dataframe()
-    df_columns = pd.MultiIndex.from_tuples(
-        [(n, t.type) for n, t in input.columns.items()],
-        names=['column header', 'type'])
-    df.columns = df_columns
-    df.reset_index(inplace=True)
-    table = df.to_json(orient='split')
+    manifest = _write_table(output_dir, input, _SHARD_ROWS,
+                            _GROUP_COLUMNS)
+    _inline_shards(output_dir, manifest, _INLINE_BYTES)
+    # Escaped like pandas' JSON, so no value can close the script tag.
+    manifest = json.dumps(manifest, separators=(',', ':')).replace('/', '\\/')
     index = os.path.join(TEMPLATES, 'tabulate', 'index.html')
     q2templates.render(index, output_dir,
-                       context={'table': table, 'page_size': page_size})
-
-    input.save(os.path.join(output_dir, 'metadata.tsv'))
+                       context={'manifest': manifest,
+                                'page_size': page_size})
 
+    # The assets are the same for every run, so they are linked from the
+    # shared asset store rather than copied.
     js = os.path.join(TEMPLATES, 'tabulate', 'datatables.min.js')
     os.mkdir(os.path.join(output_dir, 'js'))
-    shutil.copy(js, os.path.join(output_dir, 'js', 'datatables.min.js'))
+    install_asset(js, os.path.join(output_dir, 'js', 'datatables.min.js'))
 
     css = os.path.join(TEMPLATES, 'tabulate', 'datatables.min.css')
     os.mkdir(os.path.join(output_dir, 'css'))
-    shutil.copy(css, os.path.join(output_dir, 'css', 'datatables.min.css'))
+    install_asset(css, os.path.join(output_dir, 'css', 'datatables.min.css'))
@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import qiime2
+import numpy as np
+import pandas as pd
+
+from ._distance import CondensedDistanceMatrix, distance_matrix
+
+
+# Granularities admitted by the collection_timestamp rule: YYYY, YYYY-MM,
+# YYYY-MM-DD and YYYY-MM-DD hh:mm (seconds are tolerated). Whitespace around
+# the date separators, as in "2011-09 -09 14:30", is ignored.
+_TIMESTAMP = (r'^\s*(?P<year>\d{4})'
+              r'(?:\s*-\s*(?P<month>\d{1,2})'
+              r'(?:\s*-\s*(?P<day>\d{1,2})'
+              r'(?:(?:\s+|T)(?P<hour>\d{1,2}):(?P<minute>\d{2})'
+              r'(?::(?P<second>\d{2}))?)?)?)?\s*$')
+
+_UNITS = {'days': 86400, 'hours': 3600}
+
+
+def _parse_timestamps(values):
+    """Parse timestamp strings into int64 seconds since the epoch.
+
+    Each distinct string is parsed once; partial timestamps are placed at
+    the start of the period they name (e.g. "2015-05" is 2015-05-01 00:00).
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    fields = pd.Series(uniques, dtype=object).str.extract(_TIMESTAMP)
+    invalid = fields['year'].isnull().to_numpy(copy=True)
+
+    fields = fields.fillna({'month': '1', 'day': '1', 'hour': '0',
+                            'minute': '0', 'second': '0'})
+    fields = fields.fillna('0').astype(np.int64)
+    year, month, day = (fields[f].values for f in ('year', 'month', 'day'))
+    hour, minute, second = (fields[f].values
+                            for f in ('hour', 'minute', 'second'))
+
+    invalid |= (month < 1) | (month > 12)
+    invalid |= (hour > 23) | (minute > 59) | (second > 59)
+    months = ((year - 1970) * 12 + np.clip(month, 1, 12) - 1)
+    start = months.astype('datetime64[M]').astype('datetime64[D]')
+    end = (months + 1).astype('datetime64[M]').astype('datetime64[D]')
+    invalid |= (day < 1) | (day > (end - start).astype(np.int64))
+    if invalid.any():
+        raise ValueError(
+            'The following value(s) could not be parsed as timestamps '
+            '(expected YYYY, YYYY-MM, YYYY-MM-DD or YYYY-MM-DD hh:mm): %s'
+            % ', '.join(sorted(repr(v) for v in uniques[invalid])))
+
+    seconds = (start.astype(np.int64) + day - 1) * 86400
+    seconds += hour * 3600 + minute * 60 + second
+    return seconds[codes]
+
+
+def temporal_distance_matrix(metadata: qiime2.MetadataColumn,
+                             units: str = 'days',
+                             block_size: int = None,
+                             n_jobs: int = 1) -> CondensedDistanceMatrix:
+    if units not in _UNITS:
+        raise ValueError('Unknown units %r. Choose one of: %s.'
+                         % (units, ', '.join(sorted(_UNITS))))
+    if metadata.has_missing_values():
+        missing = metadata.get_ids(where_values_missing=True)
+        raise ValueError(
+            "Encountered missing value(s) in the metadata column. Computing "
+            "a distance matrix from missing values is not supported. IDs with "
+            "missing values: %s" % ', '.join(sorted(missing)))
+
+    series = metadata.to_series()
+    if isinstance(metadata, qiime2.NumericMetadataColumn):
+        # A column holding only years is inferred as numeric.
+        values = series.values
+        if not np.array_equal(values, np.floor(values)):
+            raise ValueError('A numeric timestamp column may only contain '
+                             'whole years.')
+        values = values.astype(np.int64).astype(str)
+    else:
+        values = series.values.astype(str)
+
+    seconds = _parse_timestamps(values)
+    # Offsetting by the earliest timestamp in integer arithmetic keeps the
+    # float values small, so differences are not lost to rounding.
+    elapsed = (seconds - seconds.min()) / _UNITS[units]
+    column = qiime2.NumericMetadataColumn(
+        pd.Series(elapsed, index=series.index, name=series.name))
+    return distance_matrix(column, block_size=block_size, n_jobs=n_jobs)
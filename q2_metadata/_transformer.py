@@ -7,9 +7,14 @@
 # ----------------------------------------------------------------------------
 
 
+import pandas as pd
 from qiime2.plugin import Metadata
+from q2_types.distance_matrix import LSMatFormat
+
 from .plugin_setup import plugin
-from ._format import MetadataFormat
+from ._format import (MetadataFormat, DistanceGraphFormat,
+                      DistanceMatrixBatchDirectoryFormat)
+from ._distance import CondensedDistanceMatrix, DistanceMatrices
 
 
 @plugin.register_transformer
@@ -24,3 +29,56 @@ def _1(data: Metadata) -> MetadataFormat:
 def _2(ff: MetadataFormat) -> Metadata:
     path = str(ff) + '/metadata.tsv'
     return Metadata.load(path)
+
+
+@plugin.register_transformer
+def _3(data: CondensedDistanceMatrix) -> LSMatFormat:
+    ff = LSMatFormat()
+    with ff.open() as fh:
+        data.write(fh)
+    return ff
+
+
+@plugin.register_transformer
+def _4(ff: LSMatFormat) -> CondensedDistanceMatrix:
+    with ff.open() as fh:
+        return CondensedDistanceMatrix.read(fh)
+
+
+@plugin.register_transformer
+def _5(data: pd.DataFrame) -> DistanceGraphFormat:
+    ff = DistanceGraphFormat()
+    data.to_csv(str(ff), sep='\t', index=False,
+                columns=DistanceGraphFormat.HEADER)
+    return ff
+
+
+@plugin.register_transformer
+def _6(ff: DistanceGraphFormat) -> pd.DataFrame:
+    return pd.read_csv(str(ff), sep='\t', dtype={'id1': str, 'id2': str})
+
+
+@plugin.register_transformer
+def _7(data: DistanceMatrices) -> DistanceMatrixBatchDirectoryFormat:
+    df = DistanceMatrixBatchDirectoryFormat()
+    with open(str(df.path / 'columns.txt'), 'w') as fh:
+        fh.write(''.join('%s\n' % column for column in data))
+    for index, dm in enumerate(data.values()):
+        df.matrices.write_data(dm, CondensedDistanceMatrix, index=index)
+    return df
+
+
+@plugin.register_transformer
+def _8(df: DistanceMatrixBatchDirectoryFormat) -> DistanceMatrices:
+    with open(str(df.path / 'columns.txt')) as fh:
+        columns = fh.read().splitlines()
+
+    def reader(index):
+        def read():
+            path = df.path / df.matrices_path_maker(index=index)
+            with open(str(path)) as fh:
+                return CondensedDistanceMatrix.read(fh)
+        return read
+
+    return DistanceMatrices((column, reader(index))
+                            for index, column in enumerate(columns))
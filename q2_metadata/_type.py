@@ -8,4 +8,8 @@
 
 from qiime2.plugin import SemanticType
 
-MetadataX = SemanticType('MetadataX')
\ No newline at end of file
+MetadataX = SemanticType('MetadataX')
+
+DistanceGraph = SemanticType('DistanceGraph')
+
+DistanceMatrixBatch = SemanticType('DistanceMatrixBatch')
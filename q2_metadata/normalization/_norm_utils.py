@@ -6,6 +6,9 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+import yaml
+
 
 def get_intersection(variables_rules: list, md_columns: list) -> list:
     """
@@ -53,3 +56,30 @@ def get_variables_rules_dir(rules_dir: str, RULES: str) -> str:
         variables_rules_dir = RULES
     return variables_rules_dir
 
+
+def read_variable_rules(rules_dir: str, variable: str) -> dict:
+    """
+    Read the .yml rules file of a metadata variable.
+
+    Parameters
+    ----------
+    rules_dir : str
+        Path to the folder where the .yml rules files are located.
+    variable : str
+        Name of the metadata variable, which is also the
+        name of its rules file (without extension).
+
+    Returns
+    -------
+    rules : dict
+        Rules of the variable.
+    """
+    path = os.path.join(rules_dir, '%s.yml' % variable)
+    if not os.path.isfile(path):
+        raise ValueError(
+            "No yaml rules for the metadata variable '%s' in %s."
+            % (variable, rules_dir)
+        )
+    with open(path) as handle:
+        rules = yaml.safe_load(handle)
+    return rules or {}
@@ -8,14 +8,24 @@
 
 import importlib
 import qiime2.plugin
-from qiime2.plugin import MetadataColumn, Numeric, Metadata, Str
+from qiime2.plugin import (MetadataColumn, Numeric, Categorical, Metadata, Str,
+                           Int, Float, Bool, Range, Choices, List)
 
-from q2_metadata import tabulate, distance_matrix, __version__
+from q2_metadata import (tabulate, distance_matrix, euclidean_distance_matrix,
+                         gower_distance_matrix, categorical_distance_matrix,
+                         extend_distance_matrix, batch_distance_matrix,
+                         extract_distance_matrix, geographic_distance_matrix,
+                         temporal_distance_matrix, ordinal_distance_matrix,
+                         neighbor_graph, within_group_distances,
+                         distance_summary, pcoa, mantel, __version__)
 from q2_types.distance_matrix import DistanceMatrix
+from q2_types.ordination import PCoAResults
 
 from ._normalize import normalize
-from ._type import MetadataX
-from ._format import MetadataFormat, MetadataDirectoryFormat
+from ._type import MetadataX, DistanceGraph, DistanceMatrixBatch
+from ._format import (MetadataFormat, MetadataDirectoryFormat,
+                      DistanceGraphFormat, DistanceGraphDirectoryFormat,
+                      ColumnNamesFormat, DistanceMatrixBatchDirectoryFormat)
 
 plugin = qiime2.plugin.Plugin(
     name='metadata',
@@ -33,9 +43,37 @@ plugin = qiime2.plugin.Plugin(
 plugin.methods.register_function(
     function=distance_matrix,
     inputs={},
-    parameters={'metadata': MetadataColumn[Numeric]},
+    parameters={'metadata': MetadataColumn[Numeric],
+                'block_size': Int % Range(1, None),
+                'n_jobs': Int % Range(0, None),
+                'precision': Str % Choices(['float64', 'float32', 'uint16'])},
     parameter_descriptions={'metadata': 'Numeric metadata column to compute '
-                                        'pairwise Euclidean distances from'},
+                                        'pairwise Euclidean distances from',
+                            'block_size': 'If provided, distances are not '
+                                          'held in memory: rows are computed '
+                                          'in blocks of this many rows and '
+                                          'written straight to the output '
+                                          'file. Peak memory is then about '
+                                          'block_size * n distances.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core. The '
+                                      'result does not depend on this '
+                                      'value.',
+                            'precision': 'How distances are stored while '
+                                         'the matrix is computed and '
+                                         'written. float32 halves memory '
+                                         'and each distance is the float64 '
+                                         'one rounded to nearest (relative '
+                                         'error at most 2^-24, about 6e-8). '
+                                         'uint16 quarters memory by storing '
+                                         'codes of (max - min) / 65535 '
+                                         'units, so each distance is off by '
+                                         'at most half a unit, i.e. '
+                                         '(max - min) / 131070. Compact '
+                                         'matrices are written with the '
+                                         'shortest decimal strings that '
+                                         'represent their float32 values.'},
     outputs=[('distance_matrix', DistanceMatrix)],
     name='Create a distance matrix from a numeric Metadata column',
     description='Create a distance matrix from a numeric metadata column. '
@@ -46,6 +84,366 @@ plugin.methods.register_function(
 )
 
 
+plugin.methods.register_function(
+    function=euclidean_distance_matrix,
+    inputs={},
+    parameters={'metadata': Metadata,
+                'scaling': Str % Choices(['none', 'z-score', 'range']),
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Metadata whose numeric columns are '
+                                        'used as coordinates. Categorical '
+                                        'columns are ignored.',
+                            'scaling': 'How each numeric column is scaled '
+                                       'before computing distances: '
+                                       '"z-score" subtracts the mean and '
+                                       'divides by the standard deviation, '
+                                       '"range" maps values onto [0, 1].',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    name='Create a distance matrix from several numeric Metadata columns',
+    description='Create a distance matrix from all numeric columns of the '
+                'metadata, optionally scaled. The Euclidean distance is '
+                'computed between each pair of samples or features, treating '
+                'each column as one dimension.\n\n'
+                'Distances are computed in blocks of matrix products, so '
+                'identical samples may be separated by a distance on the '
+                'order of machine precision rather than exactly zero.'
+)
+
+
+plugin.methods.register_function(
+    function=gower_distance_matrix,
+    inputs={},
+    parameters={'metadata': Metadata,
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Metadata with any mix of numeric '
+                                        'and categorical columns.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    name='Create a Gower distance matrix from mixed-type Metadata columns',
+    description='Create a distance matrix from all columns of the metadata '
+                'using the Gower distance. Each numeric column contributes '
+                'the absolute difference divided by the column\'s range, and '
+                'each categorical column contributes 0 for matching and 1 '
+                'for differing values. The distance is the mean contribution '
+                'over the columns where both samples or features have a '
+                'value, so missing values are allowed as long as every pair '
+                'shares at least one column.'
+)
+
+
+plugin.methods.register_function(
+    function=categorical_distance_matrix,
+    inputs={},
+    parameters={'metadata': Metadata,
+                'metric': Str % Choices(['hamming', 'jaccard']),
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Metadata whose categorical columns '
+                                        'are compared. Numeric columns are '
+                                        'ignored.',
+                            'metric': 'With several columns, "hamming" is '
+                                      'the fraction of columns whose values '
+                                      'differ and "jaccard" is the Jaccard '
+                                      'distance between the sets of '
+                                      '(column, value) pairs. With a single '
+                                      'column both give 0 for the same '
+                                      'value and 1 otherwise.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    name='Create a distance matrix from categorical Metadata columns',
+    description='Create a distance matrix from the categorical columns of '
+                'the metadata. With a single column, the distance between '
+                'two samples or features is 0 if they are in the same group '
+                'and 1 otherwise, which is useful with the Mantel test '
+                'available in `q2-diversity`.'
+)
+
+
+plugin.methods.register_function(
+    function=extend_distance_matrix,
+    inputs={'distance_matrix': DistanceMatrix},
+    parameters={'metadata': MetadataColumn[Numeric]},
+    input_descriptions={'distance_matrix': 'A distance matrix previously '
+                                           'created from an earlier version '
+                                           'of the metadata column.'},
+    parameter_descriptions={'metadata': 'The numeric metadata column with '
+                                        'new samples or features added. '
+                                        'Values of IDs already in the '
+                                        'distance matrix must be '
+                                        'unchanged, up to the rounding of '
+                                        'the precision the matrix was '
+                                        'stored in (float32: relative '
+                                        '2^-23; uint16: half of the '
+                                        'values\' range / 65535).'},
+    outputs=[('extended_distance_matrix', DistanceMatrix)],
+    name='Add new samples to a distance matrix from a numeric Metadata '
+         'column',
+    description='Extend a distance matrix created by `distance_matrix` with '
+                'the IDs of the metadata column that it does not contain '
+                'yet. Existing distances are reused and only the distances '
+                'involving new IDs are computed. New IDs are appended after '
+                'the existing ones, in metadata order.'
+)
+
+
+plugin.methods.register_function(
+    function=batch_distance_matrix,
+    inputs={},
+    parameters={'metadata': Metadata,
+                'columns': List[Str],
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Metadata with the numeric columns '
+                                        'to compute distance matrices from.',
+                            'columns': 'The numeric columns to use. If not '
+                                       'provided, every numeric column is '
+                                       'used.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the rows of each distance '
+                                      'matrix. Matrices are computed one '
+                                      'after the other, as they are '
+                                      'written. If 0, one job is started '
+                                      'per CPU core.'},
+    outputs=[('distance_matrices', DistanceMatrixBatch)],
+    output_descriptions={'distance_matrices': 'One distance matrix per '
+                                              'metadata column.'},
+    name='Create one distance matrix per numeric Metadata column',
+    description='Create a distance matrix for each of several numeric '
+                'metadata columns in a single pass, as `distance_matrix` '
+                'would for each column. IDs are validated and values '
+                'extracted once, and each matrix is computed block by block '
+                'while it is written, so memory stays bounded however many '
+                'columns there are. Use `extract-distance-matrix` to get '
+                'the distance matrix of one column.'
+)
+
+
+plugin.methods.register_function(
+    function=extract_distance_matrix,
+    inputs={'distance_matrices': DistanceMatrixBatch},
+    parameters={'column': Str},
+    input_descriptions={'distance_matrices': 'Distance matrices created by '
+                                             '`batch-distance-matrix`.'},
+    parameter_descriptions={'column': 'The metadata column whose distance '
+                                      'matrix is extracted.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    output_descriptions={'distance_matrix': 'The distance matrix of the '
+                                            'column.'},
+    name='Extract one distance matrix from a batch',
+    description='Extract the distance matrix of one metadata column from '
+                'the output of `batch-distance-matrix`, so that it can be '
+                'used wherever a distance matrix is accepted (e.g. in a '
+                'Mantel test). Only that matrix is read.'
+)
+
+
+plugin.methods.register_function(
+    function=geographic_distance_matrix,
+    inputs={},
+    parameters={'latitude': MetadataColumn[Numeric],
+                'longitude': MetadataColumn[Numeric],
+                'block_size': Int % Range(1, None),
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'latitude': 'Numeric metadata column of '
+                                        'latitudes, in decimal degrees.',
+                            'longitude': 'Numeric metadata column of '
+                                         'longitudes, in decimal degrees.',
+                            'block_size': 'If provided, distances are not '
+                                          'held in memory: rows are computed '
+                                          'in blocks of this many rows and '
+                                          'written straight to the output '
+                                          'file.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    name='Create a geographic distance matrix from latitude and longitude',
+    description='Create a distance matrix of great-circle (haversine) '
+                'distances, in kilometers, between the locations given by '
+                'two numeric metadata columns. The Earth is treated as a '
+                'sphere of radius 6371.0088 km, so distances can differ from '
+                'geodesic distances on the ellipsoid by up to about 0.5%.'
+)
+
+
+plugin.methods.register_function(
+    function=temporal_distance_matrix,
+    inputs={},
+    parameters={'metadata': MetadataColumn[Categorical | Numeric],
+                'units': Str % Choices(['days', 'hours']),
+                'block_size': Int % Range(1, None),
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Metadata column of timestamps, '
+                                        'such as collection_timestamp. '
+                                        'Accepted formats are YYYY, YYYY-MM, '
+                                        'YYYY-MM-DD and YYYY-MM-DD hh:mm.',
+                            'units': 'The units in which time differences '
+                                     'are reported.',
+                            'block_size': 'If provided, distances are not '
+                                          'held in memory: rows are computed '
+                                          'in blocks of this many rows and '
+                                          'written straight to the output '
+                                          'file.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    name='Create a distance matrix from sample timestamps',
+    description='Create a distance matrix of absolute time differences '
+                'between the timestamps in a metadata column. Timestamps '
+                'given at a coarser granularity than hh:mm are placed at the '
+                'start of the period they name (e.g., 2015-05 is read as '
+                '2015-05-01 00:00).'
+)
+
+
+plugin.methods.register_function(
+    function=ordinal_distance_matrix,
+    inputs={},
+    parameters={'metadata': MetadataColumn[Categorical],
+                'rules_dir': Str,
+                'block_size': Int % Range(1, None),
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Categorical metadata column with '
+                                        'an associated yaml rule that lists '
+                                        'its expected values in order.',
+                            'rules_dir': 'The path to the yaml rules folder. '
+                                         'The rule is read from the file '
+                                         'named after the metadata column. '
+                                         'Defaults to the bundled rules.',
+                            'block_size': 'If provided, distances are not '
+                                          'held in memory: rows are computed '
+                                          'in blocks of this many rows and '
+                                          'written straight to the output '
+                                          'file.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the distances. If 0, one '
+                                      'job is started per CPU core.'},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    name='Create a distance matrix from an ordered categorical column',
+    description='Create a distance matrix from an ordinal metadata column. '
+                'Values are ranked by their position in the `expected` list '
+                'of the column\'s yaml rule (e.g., Never < Rarely < Daily), '
+                'and the distance between two samples is the absolute '
+                'difference between their ranks. Blank and missing values '
+                'declared by the rule are not supported.'
+)
+
+
+plugin.methods.register_function(
+    function=neighbor_graph,
+    inputs={},
+    parameters={'metadata': MetadataColumn[Numeric],
+                'k': Int % Range(1, None),
+                'radius': Float % Range(0, None)},
+    parameter_descriptions={'metadata': 'Numeric metadata column to find '
+                                        'neighbors in.',
+                            'k': 'Connect each sample or feature to its k '
+                                 'nearest neighbors.',
+                            'radius': 'Connect each sample or feature to '
+                                      'all others whose value is within '
+                                      'this distance.'},
+    outputs=[('graph', DistanceGraph)],
+    output_descriptions={'graph': 'Edge list with one row per neighbor of '
+                                  'each sample or feature, and the '
+                                  'Euclidean distance between them.'},
+    name='Create a sparse neighbor graph from a numeric Metadata column',
+    description='Create a k-nearest-neighbor or radius graph from a numeric '
+                'metadata column. Exactly one of `k` or `radius` must be '
+                'provided. The column is sorted once and neighbors are '
+                'found in sorted order, so the cost grows with the number '
+                'of edges rather than with the square of the number of '
+                'samples or features. Ties at the k-th neighbor are broken '
+                'by sorted order.'
+)
+
+
+plugin.methods.register_function(
+    function=within_group_distances,
+    inputs={},
+    parameters={'metadata': MetadataColumn[Numeric],
+                'groups': MetadataColumn[Categorical],
+                'n_jobs': Int % Range(0, None)},
+    parameter_descriptions={'metadata': 'Numeric metadata column to compute '
+                                        'pairwise Euclidean distances from.',
+                            'groups': 'Categorical metadata column, such as '
+                                      'a subject or site, defining which '
+                                      'samples or features are compared.',
+                            'n_jobs': 'The number of concurrent jobs used '
+                                      'to compute the groups. If 0, one job '
+                                      'is started per CPU core.'},
+    outputs=[('graph', DistanceGraph)],
+    output_descriptions={'graph': 'Edge list with one row per ordered pair '
+                                  'of samples or features in the same '
+                                  'group, and the Euclidean distance '
+                                  'between them.'},
+    name='Compute distances between Metadata values within groups only',
+    description='Compute the Euclidean distances between the values of a '
+                'numeric metadata column, only for pairs of samples or '
+                'features that share a group. Each group is computed '
+                'independently, so the cost is the sum of the squared group '
+                'sizes rather than the square of the total number of '
+                'samples or features.'
+)
+
+
+plugin.methods.register_function(
+    function=distance_summary,
+    inputs={},
+    parameters={'metadata': MetadataColumn[Numeric],
+                'delta': Float % Range(0, None)},
+    parameter_descriptions={'metadata': 'Numeric metadata column to '
+                                        'summarize distances from.',
+                            'delta': 'IDs within this distance of a sample '
+                                     '(inclusive) are counted as its close '
+                                     'neighbors.'},
+    outputs=[('summary', MetadataX)],
+    output_descriptions={'summary': 'Per-ID summary with the columns '
+                                    'mean_distance and ids_within_delta.'},
+    name='Summarize per-sample metadata distances',
+    description='Compute, for every ID, the mean Euclidean distance to all '
+                'other IDs and the number of other IDs within delta of it. '
+                'The summaries are computed from the sorted metadata column '
+                'in O(n log n) time, without building a distance matrix.'
+)
+
+
+plugin.methods.register_function(
+    function=pcoa,
+    inputs={},
+    parameters={'metadata': Metadata,
+                'scaling': Str % Choices(['none', 'z-score', 'range']),
+                'number_of_dimensions': Int % Range(1, None)},
+    parameter_descriptions={'metadata': 'Metadata whose numeric columns are '
+                                        'ordinated. Categorical columns are '
+                                        'ignored.',
+                            'scaling': 'How each numeric column is scaled '
+                                       'before the ordination, as in '
+                                       '`euclidean-distance-matrix`.',
+                            'number_of_dimensions': 'The number of axes to '
+                                                    'return. Defaults to '
+                                                    'all of them, at most '
+                                                    'one per numeric '
+                                                    'column.'},
+    outputs=[('pcoa', PCoAResults)],
+    name='Principal Coordinate Analysis of numeric Metadata columns',
+    description='Compute the principal coordinates of the Euclidean '
+                'distances between samples or features, treating each '
+                'numeric metadata column as one dimension. The result is '
+                'the same as running `euclidean-distance-matrix` followed by '
+                'PCoA in `q2-diversity`, but it is computed with a thin SVD '
+                'of the centered values, so no distance matrix is built and '
+                'the cost grows linearly with the number of samples or '
+                'features. Axes are signed so that the coordinate with the '
+                'largest magnitude is positive.'
+)
+
+
 plugin.methods.register_function(
     function=normalize,
     inputs={},
@@ -73,8 +471,9 @@ plugin.visualizers.register_function(
     },
     parameter_descriptions={
         'input': 'The metadata to tabulate.',
-        'page_size': 'The maximum number of Metadata records to display '
-                     'per page',
+        'page_size': 'The number of Metadata records loaded when the '
+                     'table is first displayed. Further records are '
+                     'loaded as the table is scrolled.',
     },
     name='Interactively explore Metadata in an HTML table',
     description='Generate a tabular view of Metadata. The output '
@@ -83,9 +482,64 @@ plugin.visualizers.register_function(
 )
 
 
-plugin.register_semantic_types(MetadataX)
+plugin.visualizers.register_function(
+    function=mantel,
+    inputs={'distance_matrix': DistanceMatrix},
+    parameters={
+        'metadata': MetadataColumn[Numeric],
+        'method': Str % Choices(['spearman', 'pearson']),
+        'permutations': Int % Range(0, None),
+        'intersect_ids': Bool,
+        'seed': Int,
+        'n_jobs': Int % Range(0, None),
+    },
+    input_descriptions={
+        'distance_matrix': 'The distance matrix to compare with the '
+                           'metadata column.',
+    },
+    parameter_descriptions={
+        'metadata': 'Numeric metadata column whose pairwise Euclidean '
+                    'distances are compared with the distance matrix.',
+        'method': 'The correlation test to be applied in the Mantel test.',
+        'permutations': 'The number of permutations to be run when '
+                        'computing p-values. Supplying a value of zero will '
+                        'disable permutation testing and p-values will not '
+                        'be calculated.',
+        'intersect_ids': 'If supplied, IDs that are not found in both the '
+                         'distance matrix and the metadata column will be '
+                         'discarded before applying the Mantel test. '
+                         'Default behavior is to error on any mismatched '
+                         'IDs.',
+        'seed': 'Seed for the permutations. Results match running '
+                '`distance-matrix` followed by the Mantel test in '
+                '`q2-diversity` (scikit-bio\'s `mantel`) with the same '
+                'seed, for any number of jobs.',
+        'n_jobs': 'The number of concurrent jobs used to evaluate the '
+                  'permutations. If 0, one job is started per CPU core.',
+    },
+    name='Apply the Mantel test to a distance matrix and a numeric '
+         'Metadata column',
+    description='Apply a two-sided Mantel test to the distance matrix and '
+                'the Euclidean distances between the values of a numeric '
+                'metadata column, without creating a distance matrix from '
+                'the metadata. For the Pearson method, metadata distances '
+                'are generated block by block for each permutation; for the '
+                'Spearman method, their ranks are held once in condensed '
+                'form. The metadata distances are the ones permuted.'
+)
+
+
+plugin.register_semantic_types(MetadataX, DistanceGraph, DistanceMatrixBatch)
 plugin.register_semantic_type_to_format(
     MetadataX, artifact_format=MetadataDirectoryFormat
 )
-plugin.register_formats(MetadataFormat, MetadataDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    DistanceGraph, artifact_format=DistanceGraphDirectoryFormat
+)
+plugin.register_semantic_type_to_format(
+    DistanceMatrixBatch, artifact_format=DistanceMatrixBatchDirectoryFormat
+)
+plugin.register_formats(MetadataFormat, MetadataDirectoryFormat,
+                        DistanceGraphFormat, DistanceGraphDirectoryFormat,
+                        ColumnNamesFormat, DistanceMatrixBatchDirectoryFormat)
 importlib.import_module('q2_metadata._transformer')
\ No newline at end of file
@@ -6,8 +6,11 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+import tempfile
 import unittest
-from q2_metadata.normalization._norm_utils import get_intersection
+from q2_metadata.normalization._norm_utils import (get_intersection,
+                                                   read_variable_rules)
 
 
 class NormalizationUtilsTests(unittest.TestCase):
@@ -29,6 +32,21 @@ class NormalizationUtilsTests(unittest.TestCase):
         intersect = get_intersection(['a', 'b', 'c'], ['a', 'b', 'd'])
         self.assertEqual(intersect, ['a', 'b'])
 
+    def test_read_variable_rules(self):
+
+        with tempfile.TemporaryDirectory() as rules_dir:
+            with open(os.path.join(rules_dir, 'a.yml'), 'w') as handle:
+                handle.write('format: str\nexpected:\n- low\n- high\n')
+            open(os.path.join(rules_dir, 'empty.yml'), 'w').close()
+
+            rules = read_variable_rules(rules_dir, 'a')
+            self.assertEqual(rules, {'format': 'str',
+                                     'expected': ['low', 'high']})
+            self.assertEqual(read_variable_rules(rules_dir, 'empty'), {})
+
+            with self.assertRaisesRegex(ValueError, "variable 'b'"):
+                read_variable_rules(rules_dir, 'b')
+
 
 if __name__ == '__main__':
     unittest.main()
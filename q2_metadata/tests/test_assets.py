@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import os
+import stat
+import tempfile
+import unittest
+import unittest.mock
+
+from q2_metadata import _assets
+from q2_metadata._assets import (asset_store, stored_asset, link_or_copy,
+                                 install_asset)
+
+
+class AssetStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, 'store')
+        self.src = os.path.join(self.tmp.name, 'datatables.min.js')
+        with open(self.src, 'w') as fh:
+            fh.write('var x = 1;\n' * 100)
+        patcher = unittest.mock.patch.dict(
+            os.environ, {'Q2_METADATA_ASSET_STORE': self.store})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def read(self, path, mode='r'):
+        with open(path, mode) as fh:
+            return fh.read()
+
+    def test_store_location(self):
+        self.assertEqual(asset_store(), self.store)
+
+        with unittest.mock.patch.dict(os.environ,
+                                      {'Q2_METADATA_ASSET_STORE': ''}):
+            self.assertTrue(asset_store().startswith(tempfile.gettempdir()))
+
+    def test_content_addressed(self):
+        digest = hashlib.sha256(self.read(self.src, 'rb')).hexdigest()
+
+        path = stored_asset(self.src)
+
+        self.assertEqual(path, os.path.join(
+            self.store, digest + '-datatables.min.js'))
+        self.assertEqual(self.read(path), self.read(self.src))
+        # Next to the digest recorded for the source.
+        self.assertEqual(
+            [name for name in os.listdir(self.store)
+             if not name.startswith('.')], [os.path.basename(path)])
+
+    @unittest.skipUnless(os.name == 'posix', 'POSIX permissions')
+    def test_store_is_private(self):
+        stored_asset(self.src)
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.store).st_mode), 0o700)
+
+    @unittest.skipUnless(os.name == 'posix', 'POSIX permissions')
+    def test_store_writable_by_others_is_not_used(self):
+        os.mkdir(self.store)
+        os.chmod(self.store, 0o777)
+        dest = os.path.join(self.tmp.name, 'copied.js')
+
+        self.assertEqual(install_asset(self.src, dest), 'copy')
+        self.assertEqual(os.listdir(self.store), [])
+        self.assertEqual(self.read(dest), self.read(self.src))
+
+    @unittest.skipUnless(os.name == 'posix', 'POSIX ownership')
+    def test_store_of_another_user_is_not_used(self):
+        os.mkdir(self.store, 0o700)
+        dest = os.path.join(self.tmp.name, 'copied.js')
+
+        with unittest.mock.patch('os.getuid', return_value=os.getuid() + 1):
+            self.assertEqual(install_asset(self.src, dest), 'copy')
+        self.assertEqual(os.listdir(self.store), [])
+
+    def test_tampered_asset_is_not_linked(self):
+        path = stored_asset(self.src)
+        os.chmod(path, 0o600)
+        with open(path, 'w') as fh:
+            fh.write('alert(1);\n')
+        dest = os.path.join(self.tmp.name, 'copied.js')
+
+        self.assertEqual(install_asset(self.src, dest), 'copy')
+        self.assertFalse(os.path.samefile(path, dest))
+        self.assertEqual(self.read(dest), self.read(self.src))
+
+    def test_unchanged_asset_is_not_hashed_again(self):
+        path = stored_asset(self.src)
+        # As in a new process.
+        _assets._digest.cache_clear()
+
+        with unittest.mock.patch('q2_metadata._assets._sha256') as sha256:
+            self.assertEqual(stored_asset(self.src), path)
+        sha256.assert_not_called()
+
+    def test_asset_stored_from_another_copy(self):
+        path = stored_asset(self.src)
+        # Same content, as after reinstalling the package.
+        os.utime(self.src, ns=(0, 0))
+
+        self.assertEqual(stored_asset(self.src), path)
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+        with unittest.mock.patch('q2_metadata._assets._sha256') as sha256:
+            self.assertEqual(stored_asset(self.src), path)
+        sha256.assert_not_called()
+
+    def test_changed_content_is_stored_again(self):
+        first = stored_asset(self.src)
+        with open(self.src, 'a') as fh:
+            fh.write('var y = 2;\n')
+
+        second = stored_asset(self.src)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.read(second), self.read(self.src))
+
+    def test_install_links_one_copy(self):
+        dests = [os.path.join(self.tmp.name, name) for name in 'ab']
+        for dest in dests:
+            self.assertEqual(install_asset(self.src, dest), 'hardlink')
+
+        self.assertTrue(os.path.samefile(*dests))
+        self.assertTrue(os.path.samefile(dests[0], stored_asset(self.src)))
+        self.assertEqual(self.read(dests[0]), self.read(self.src))
+
+    def test_link_falls_back_to_copy(self):
+        dest = os.path.join(self.tmp.name, 'copied.js')
+        with unittest.mock.patch('os.link', side_effect=OSError), \
+                unittest.mock.patch('q2_metadata._assets._reflink',
+                                    side_effect=OSError):
+            self.assertEqual(link_or_copy(self.src, dest), 'copy')
+
+        self.assertFalse(os.path.samefile(self.src, dest))
+        self.assertEqual(self.read(dest), self.read(self.src))
+
+    def test_unusable_store(self):
+        # A file where the store's directory should be.
+        open(self.store, 'w').close()
+        dest = os.path.join(self.tmp.name, 'copied.js')
+
+        self.assertEqual(install_asset(self.src, dest), 'copy')
+        self.assertEqual(self.read(dest), self.read(self.src))
+
+
+if __name__ == '__main__':
+    unittest.main()
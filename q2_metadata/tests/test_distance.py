@@ -6,14 +6,23 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import io
 import unittest
+import unittest.mock
+import warnings
 
 import pandas as pd
 import numpy as np
+import scipy.spatial
 import skbio
 import qiime2
 
-from q2_metadata import distance_matrix
+from q2_metadata import (distance_matrix, euclidean_distance_matrix,
+                         gower_distance_matrix, categorical_distance_matrix,
+                         extend_distance_matrix, batch_distance_matrix,
+                         extract_distance_matrix, geographic_distance_matrix)
+from q2_metadata._distance import (CondensedDistanceMatrix, DistanceMatrices,
+                                   _Throughput)
 
 
 class DistanceMatrixTests(unittest.TestCase):
@@ -70,6 +79,809 @@ class DistanceMatrixTests(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, 'missing values'):
             distance_matrix(md)
 
+    def test_block_size_matches_in_memory(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([0.1, 7.3, -2.5, 4.0, 4.0, 1e3, 0.3], name='number',
+                      index=pd.Index(['s%d' % i for i in range(7)],
+                                     name='id'))
+        )
+        exp = distance_matrix(md)
+
+        for block_size in (1, 3, 7, 100):
+            obs = distance_matrix(md, block_size=block_size)
+            np.testing.assert_array_equal(obs.condensed_form(),
+                                          exp.condensed_form())
+
+            exp_fh, obs_fh = io.StringIO(), io.StringIO()
+            exp.write(exp_fh)
+            obs.write(obs_fh)
+            self.assertEqual(obs_fh.getvalue(), exp_fh.getvalue())
+
+    def test_block_size_one_sample(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.5], name='number',
+                      index=pd.Index(['sample1'], name='id'))
+        )
+        obs = distance_matrix(md, block_size=10)
+
+        self.assertEqual(skbio.DistanceMatrix([[0.0]], ids=['sample1']),
+                         obs.to_skbio())
+
+    def test_n_jobs_matches_serial(self):
+        values = np.random.RandomState(0).normal(size=103) * 1e3
+        md = qiime2.NumericMetadataColumn(
+            pd.Series(values, name='number',
+                      index=pd.Index(['s%d' % i for i in range(103)],
+                                     name='id'))
+        )
+        exp = distance_matrix(md)
+
+        for n_jobs in (2, 3, 0):
+            obs = distance_matrix(md, n_jobs=n_jobs)
+            np.testing.assert_array_equal(obs.condensed_form(),
+                                          exp.condensed_form())
+
+            obs = distance_matrix(md, block_size=10, n_jobs=n_jobs)
+            np.testing.assert_array_equal(obs.condensed_form(),
+                                          exp.condensed_form())
+
+    def test_n_jobs_small_inputs(self):
+        for n in (1, 2, 3):
+            md = qiime2.NumericMetadataColumn(
+                pd.Series(np.arange(n, dtype=float), name='number',
+                          index=pd.Index(['s%d' % i for i in range(n)],
+                                         name='id'))
+            )
+            self.assertEqual(distance_matrix(md, n_jobs=4),
+                             distance_matrix(md))
+
+    def test_invalid_n_jobs(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.0], name='number',
+                      index=pd.Index(['sample1'], name='id'))
+        )
+        with self.assertRaisesRegex(ValueError, 'n_jobs'):
+            distance_matrix(md, n_jobs=-1)
+
+    def test_invalid_block_size(self):
+        with self.assertRaisesRegex(ValueError, 'at least one row'):
+            CondensedDistanceMatrix.from_row_blocks(
+                lambda start, stop: None, ids=['a'], block_size=0)
+
+    def precision_column(self):
+        # height_cm-like values far from zero, so float32 rounding of the
+        # values themselves (rather than of the distances) would show.
+        values = np.random.RandomState(0).normal(170, 10, size=151)
+        return qiime2.NumericMetadataColumn(
+            pd.Series(values, name='height_cm',
+                      index=pd.Index(['s%d' % i for i in range(151)],
+                                     name='id'))
+        )
+
+    def test_float32_precision(self):
+        md = self.precision_column()
+        exp = distance_matrix(md).condensed_form()
+
+        for kwargs in ({}, {'n_jobs': 3}, {'block_size': 10}):
+            obs = distance_matrix(md, precision='float32', **kwargs)
+            self.assertEqual(obs.dtype, np.float32)
+            self.assertIsNone(obs.scale)
+            # Each distance is the float64 one rounded to nearest.
+            np.testing.assert_array_equal(obs.condensed_form(),
+                                          exp.astype(np.float32))
+            self.assertTrue(np.all(np.abs(obs.condensed_form() - exp) <=
+                                   exp * 2.0 ** -24))
+
+    def test_float32_precision_extreme_magnitudes(self):
+        # Squaring these in float32 would overflow to inf or underflow to 0.
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([0.0, 1e20, 3e-25], name='number',
+                      index=pd.Index(['a', 'b', 'c'], name='id'))
+        )
+        exp = np.array([1e20, 3e-25, 1e20])
+
+        for kwargs in ({}, {'n_jobs': 2}, {'block_size': 1}):
+            obs = distance_matrix(md, precision='float32', **kwargs)
+            np.testing.assert_array_equal(obs.condensed_form(),
+                                          exp.astype(np.float32))
+
+    def test_uint16_precision(self):
+        md = self.precision_column()
+        values = md.to_series().values
+        exp = distance_matrix(md).condensed_form()
+        scale = np.ptp(values) / 65535
+
+        for kwargs in ({}, {'n_jobs': 3}, {'block_size': 10}):
+            obs = distance_matrix(md, precision='uint16', **kwargs)
+            self.assertEqual(obs.dtype, np.uint16)
+            self.assertEqual(obs.scale, scale)
+            self.assertEqual(obs.condensed_form().dtype, np.float32)
+            error = np.abs(obs.condensed_form() - exp)
+            self.assertLessEqual(error.max(),
+                                 scale / 2 + np.ptp(values) * 2.0 ** -24)
+        self.assertEqual(distance_matrix(md, precision='uint16').row(3)[3],
+                         0)
+
+    def test_uint16_precision_constant_column(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([2.0, 2.0, 2.0], name='number',
+                      index=pd.Index(['a', 'b', 'c'], name='id'))
+        )
+        obs = distance_matrix(md, precision='uint16')
+
+        np.testing.assert_array_equal(obs.condensed_form(), [0, 0, 0])
+
+    def test_compact_precision_serialization(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([0.1, 0.3, 1.7], name='number',
+                      index=pd.Index(['a', 'b', 'c'], name='id'))
+        )
+        for precision in ('float32', 'uint16'):
+            dm = distance_matrix(md, precision=precision)
+            fh = io.StringIO()
+            dm.write(fh)
+            fh.seek(0)
+            # Rows hold the shortest strings that round-trip in float32.
+            self.assertEqual(fh.getvalue().splitlines()[1].split('\t')[2],
+                             str(dm.row(0)[1]))
+            obs = CondensedDistanceMatrix.read(fh).condensed_form()
+            np.testing.assert_array_equal(obs.astype(np.float32),
+                                          dm.condensed_form())
+
+    def test_invalid_precision(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.0], name='number',
+                      index=pd.Index(['sample1'], name='id'))
+        )
+        with self.assertRaisesRegex(ValueError, 'precision'):
+            distance_matrix(md, precision='float16')
+
+
+class EuclideanDistanceMatrixTests(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.Index(['s%d' % i for i in range(50)], name='id')
+        state = np.random.RandomState(0)
+        self.df = pd.DataFrame({'ph': state.uniform(4, 9, size=50),
+                                'temperature': state.normal(15, 5, size=50),
+                                'depth': state.exponential(100, size=50)},
+                               index=self.index)
+
+    def assertDistancesClose(self, obs, X):
+        self.assertEqual(obs.ids, tuple(self.index))
+        np.testing.assert_allclose(obs.condensed_form(),
+                                   scipy.spatial.distance.pdist(X),
+                                   rtol=1e-10, atol=1e-10)
+
+    def test_no_scaling(self):
+        obs = euclidean_distance_matrix(qiime2.Metadata(self.df))
+
+        self.assertDistancesClose(obs, self.df.values)
+
+    def test_z_score(self):
+        obs = euclidean_distance_matrix(qiime2.Metadata(self.df),
+                                        scaling='z-score')
+        X = (self.df - self.df.mean()) / self.df.std(ddof=0)
+
+        self.assertDistancesClose(obs, X.values)
+
+    def test_range(self):
+        obs = euclidean_distance_matrix(qiime2.Metadata(self.df),
+                                        scaling='range')
+        X = (self.df - self.df.min()) / (self.df.max() - self.df.min())
+
+        self.assertDistancesClose(obs, X.values)
+
+    def test_constant_column(self):
+        self.df['constant'] = 3.0
+        obs = euclidean_distance_matrix(qiime2.Metadata(self.df),
+                                        scaling='z-score')
+        X = (self.df - self.df.mean()) / self.df.std(ddof=0)
+
+        self.assertDistancesClose(obs, X.drop(columns='constant').values)
+
+    def test_single_column_matches_distance_matrix(self):
+        md = qiime2.Metadata(self.df[['depth']])
+        exp = distance_matrix(md.get_column('depth'))
+        obs = euclidean_distance_matrix(md)
+
+        self.assertEqual(obs.ids, exp.ids)
+        np.testing.assert_allclose(obs.condensed_form(),
+                                   exp.condensed_form(), atol=1e-10)
+
+    def test_categorical_columns_ignored(self):
+        self.df['site'] = 'a'
+        obs = euclidean_distance_matrix(qiime2.Metadata(self.df))
+
+        self.assertDistancesClose(obs, self.df.drop(columns='site').values)
+
+    def test_n_jobs(self):
+        md = qiime2.Metadata(self.df)
+
+        np.testing.assert_array_equal(
+            euclidean_distance_matrix(md, n_jobs=3).condensed_form(),
+            euclidean_distance_matrix(md).condensed_form())
+
+    def test_no_numeric_columns(self):
+        md = qiime2.Metadata(pd.DataFrame({'site': ['a', 'b']},
+                                          index=self.index[:2]))
+
+        with self.assertRaisesRegex(ValueError, 'any numeric columns'):
+            euclidean_distance_matrix(md)
+
+    def test_missing_values(self):
+        self.df.loc['s3', 'ph'] = np.nan
+
+        with self.assertRaisesRegex(ValueError, 'missing values: s3'):
+            euclidean_distance_matrix(qiime2.Metadata(self.df))
+
+
+class GowerDistanceMatrixTests(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.Index(['s1', 's2', 's3', 's4'], name='id')
+
+    def test_mixed_columns(self):
+        md = qiime2.Metadata(pd.DataFrame(
+            {'height_cm': [150.0, 160.0, 170.0, 190.0],
+             'body_product': ['stool', 'stool', 'saliva', 'stool'],
+             'diabetes': ['no', 'yes', 'no', 'no']},
+            index=self.index))
+        # height contributes |x_i - x_j| / 40, each categorical 0 or 1.
+        exp = skbio.DistanceMatrix(
+            [[0.0, (0.25 + 0 + 1) / 3, (0.5 + 1 + 0) / 3, (1.0 + 0 + 0) / 3],
+             [(0.25 + 0 + 1) / 3, 0.0, (0.25 + 1 + 1) / 3,
+              (0.75 + 0 + 1) / 3],
+             [(0.5 + 1 + 0) / 3, (0.25 + 1 + 1) / 3, 0.0,
+              (0.5 + 1 + 0) / 3],
+             [(1.0 + 0 + 0) / 3, (0.75 + 0 + 1) / 3, (0.5 + 1 + 0) / 3,
+              0.0]],
+            ids=self.index)
+
+        obs = gower_distance_matrix(md)
+
+        np.testing.assert_allclose(obs.redundant_form(), exp.data)
+        self.assertEqual(obs.ids, exp.ids)
+
+    def test_missing_values_skipped(self):
+        md = qiime2.Metadata(pd.DataFrame(
+            {'height_cm': [150.0, np.nan, 170.0, 190.0],
+             'country': ['USA', 'USA', np.nan, 'France'],
+             'diabetes': ['no', 'no', 'no', 'yes']},
+            index=self.index))
+
+        obs = gower_distance_matrix(md).redundant_form()
+
+        # Each pair is averaged over the columns both IDs have values for.
+        self.assertEqual(obs[0, 1], 0.0)
+        self.assertEqual(obs[0, 2], 0.5 / 2)
+        self.assertEqual(obs[0, 3], 3.0 / 3)
+        self.assertEqual(obs[1, 3], 2.0 / 2)
+
+    def test_column_without_values(self):
+        df = pd.DataFrame(
+            {'height_cm': [150.0, np.nan, 170.0, 190.0],
+             'diabetes': ['no', 'no', 'no', 'yes']},
+            index=self.index)
+        exp = gower_distance_matrix(qiime2.Metadata(df))
+        df['weight_kg'] = np.nan
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            obs = gower_distance_matrix(qiime2.Metadata(df))
+
+        self.assertEqual(obs, exp)
+
+    def test_undefined_pair(self):
+        md = qiime2.Metadata(pd.DataFrame(
+            {'height_cm': [150.0, np.nan, 170.0, 190.0],
+             'country': ['USA', 'USA', np.nan, 'France']},
+            index=self.index))
+
+        with self.assertRaisesRegex(ValueError, 's2 and s3'):
+            gower_distance_matrix(md)
+
+    def test_only_categorical(self):
+        md = qiime2.Metadata(pd.DataFrame(
+            {'country': ['USA', 'USA', 'France', 'Peru']},
+            index=self.index))
+
+        obs = gower_distance_matrix(md)
+
+        np.testing.assert_array_equal(obs.condensed_form(),
+                                      [0, 1, 1, 1, 1, 1])
+
+    def test_n_jobs(self):
+        state = np.random.RandomState(1)
+        index = pd.Index(['s%d' % i for i in range(40)], name='id')
+        md = qiime2.Metadata(pd.DataFrame(
+            {'x': state.normal(size=40),
+             'y': state.choice(['a', 'b', 'c'], size=40)},
+            index=index))
+
+        np.testing.assert_array_equal(
+            gower_distance_matrix(md, n_jobs=3).condensed_form(),
+            gower_distance_matrix(md).condensed_form())
+
+    def test_no_columns(self):
+        md = qiime2.Metadata(pd.DataFrame(index=self.index))
+
+        with self.assertRaisesRegex(ValueError, 'any columns'):
+            gower_distance_matrix(md)
+
+
+class CategoricalDistanceMatrixTests(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.Index(['s1', 's2', 's3', 's4'], name='id')
+        self.df = pd.DataFrame(
+            {'body_product': ['stool', 'stool', 'saliva', 'stool'],
+             'diabetes': ['no', 'yes', 'no', 'no'],
+             'country': ['USA', 'USA', 'USA', 'France']},
+            index=self.index)
+
+    def test_single_column(self):
+        md = qiime2.Metadata(self.df[['body_product']])
+        exp = skbio.DistanceMatrix([[0, 0, 1, 0],
+                                    [0, 0, 1, 0],
+                                    [1, 1, 0, 1],
+                                    [0, 0, 1, 0]], ids=self.index)
+
+        for metric in ('hamming', 'jaccard'):
+            obs = categorical_distance_matrix(md, metric=metric)
+            self.assertEqual(exp, obs.to_skbio())
+
+    def test_hamming_matches_pdist(self):
+        md = qiime2.Metadata(self.df)
+        codes = np.column_stack([pd.factorize(self.df[c])[0]
+                                 for c in self.df.columns])
+
+        obs = categorical_distance_matrix(md, metric='hamming')
+
+        np.testing.assert_allclose(
+            obs.condensed_form(),
+            scipy.spatial.distance.pdist(codes, metric='hamming'))
+
+    def test_jaccard_matches_one_hot_pdist(self):
+        md = qiime2.Metadata(self.df)
+        onehot = pd.get_dummies(self.df).values.astype(bool)
+
+        obs = categorical_distance_matrix(md, metric='jaccard')
+
+        np.testing.assert_allclose(
+            obs.condensed_form(),
+            scipy.spatial.distance.pdist(onehot, metric='jaccard'))
+
+    def test_many_levels(self):
+        state = np.random.RandomState(2)
+        df = pd.DataFrame({'a': state.choice(list('abcdefghijk'), size=60),
+                           'b': state.choice(list('xyz'), size=60),
+                           'c': state.choice(list('0123456789'), size=60),
+                           'n': state.normal(size=60)},
+                          index=pd.Index(['s%d' % i for i in range(60)],
+                                         name='id'))
+        md = qiime2.Metadata(df)
+        onehot = pd.get_dummies(df[['a', 'b', 'c']]).values.astype(bool)
+
+        np.testing.assert_allclose(
+            categorical_distance_matrix(md, 'jaccard').condensed_form(),
+            scipy.spatial.distance.pdist(onehot, metric='jaccard'))
+        np.testing.assert_array_equal(
+            categorical_distance_matrix(md, n_jobs=3).condensed_form(),
+            categorical_distance_matrix(md).condensed_form())
+
+    def test_no_categorical_columns(self):
+        md = qiime2.Metadata(pd.DataFrame({'x': [1.0, 2.0]},
+                                          index=self.index[:2]))
+
+        with self.assertRaisesRegex(ValueError, 'any categorical columns'):
+            categorical_distance_matrix(md)
+
+    def test_missing_values(self):
+        self.df.loc['s2', 'country'] = np.nan
+
+        with self.assertRaisesRegex(ValueError, 'missing values: s2'):
+            categorical_distance_matrix(qiime2.Metadata(self.df))
+
+
+class ExtendDistanceMatrixTests(unittest.TestCase):
+    def column(self, values, ids):
+        return qiime2.NumericMetadataColumn(
+            pd.Series(values, name='number', index=pd.Index(ids, name='id')))
+
+    def test_extend(self):
+        old = distance_matrix(self.column([1.0, 4.0, 2.5],
+                                          ['s1', 's2', 's3']))
+        md = self.column([10.0, 1.0, 2.5, 4.0, -3.0],
+                         ['s4', 's1', 's3', 's2', 's5'])
+
+        obs = extend_distance_matrix(old, md)
+        exp = distance_matrix(self.column([1.0, 4.0, 2.5, 10.0, -3.0],
+                                          ['s1', 's2', 's3', 's4', 's5']))
+
+        self.assertEqual(obs.ids, ('s1', 's2', 's3', 's4', 's5'))
+        np.testing.assert_array_equal(obs.condensed_form(),
+                                      exp.condensed_form())
+        np.testing.assert_array_equal(obs.redundant_form(),
+                                      obs.redundant_form().T)
+
+    def test_extend_large(self):
+        values = np.random.RandomState(0).normal(size=120)
+        ids = ['s%d' % i for i in range(120)]
+        old = distance_matrix(self.column(values[:100], ids[:100]))
+
+        obs = extend_distance_matrix(old, self.column(values, ids))
+        exp = distance_matrix(self.column(values, ids))
+
+        self.assertEqual(obs, exp)
+
+    def test_shifted_values_accepted(self):
+        old = distance_matrix(self.column([1.0, 4.0, 2.5],
+                                          ['s1', 's2', 's3']))
+        md = self.column([11.0, 14.0, 12.5, 0.0], ['s1', 's2', 's3', 's4'])
+
+        obs = extend_distance_matrix(old, md)
+
+        np.testing.assert_array_equal(obs.row(3), [11.0, 14.0, 12.5, 0.0])
+
+    def test_nothing_new(self):
+        old = distance_matrix(self.column([1.0, 4.0], ['s1', 's2']))
+
+        self.assertEqual(
+            extend_distance_matrix(old, self.column([1.0, 4.0],
+                                                    ['s1', 's2'])),
+            old)
+
+    def test_changed_values(self):
+        old = distance_matrix(self.column([1.0, 4.0, 2.5, 3.0],
+                                          ['s1', 's2', 's3', 's4']))
+        md = self.column([1.0, 4.0, 3.5, 3.0], ['s1', 's2', 's3', 's4'])
+
+        with self.assertRaisesRegex(ValueError, 'changed.*s3'):
+            extend_distance_matrix(old, md)
+
+    def test_extend_after_round_trip(self):
+        values = np.random.RandomState(1).uniform(0, 300, size=60)
+        ids = ['s%d' % i for i in range(60)]
+        md = self.column(values, ids)
+        exp = distance_matrix(md)
+
+        for precision in ('float64', 'float32', 'uint16'):
+            fh = io.StringIO()
+            distance_matrix(self.column(values[:50], ids[:50]),
+                            precision=precision).write(fh)
+            fh.seek(0)
+            old = CondensedDistanceMatrix.read(fh)
+
+            obs = extend_distance_matrix(old, md)
+            self.assertEqual(obs.ids, exp.ids)
+            np.testing.assert_array_equal(obs.redundant_form()[:50, :50],
+                                          old.redundant_form())
+            np.testing.assert_array_equal(obs.redundant_form()[50:],
+                                          exp.redundant_form()[50:])
+
+    def test_changed_values_compact_precision(self):
+        values = np.random.RandomState(1).uniform(0, 300, size=20)
+        ids = ['s%d' % i for i in range(20)]
+        changed = values.copy()
+        # Well above half a uint16 step (300 / 65535 / 2).
+        changed[5] += 0.01
+        for precision in ('float32', 'uint16'):
+            old = distance_matrix(self.column(values, ids),
+                                  precision=precision)
+
+            with self.assertRaisesRegex(ValueError, 'changed'):
+                extend_distance_matrix(old, self.column(changed, ids))
+
+    def test_small_change_float64(self):
+        old = distance_matrix(self.column([0.0, 10.0, 20.0, 50.0, 100.0],
+                                          ['s0', 's1', 's2', 's3', 's4']))
+        md = self.column([0.0, 10.0, 20.0005, 50.0, 100.0, 7.0],
+                         ['s0', 's1', 's2', 's3', 's4', 's5'])
+
+        with self.assertRaisesRegex(ValueError, 'changed.*s2'):
+            extend_distance_matrix(old, md)
+
+    def test_small_change_after_round_trip(self):
+        values = np.random.RandomState(1).uniform(0, 300, size=20)
+        ids = ['s%d' % i for i in range(20)]
+        changed = values.copy()
+        changed[5] += 1e-6
+        fh = io.StringIO()
+        distance_matrix(self.column(values, ids)).write(fh)
+        fh.seek(0)
+
+        with self.assertRaisesRegex(ValueError, 'changed.*s5'):
+            extend_distance_matrix(CondensedDistanceMatrix.read(fh),
+                                   self.column(changed, ids))
+
+    def test_reflected_value(self):
+        # s3 keeps its distance to s1 but not to s2.
+        old = distance_matrix(self.column([1.0, 4.0, 2.5],
+                                          ['s1', 's2', 's3']))
+        md = self.column([1.0, 4.0, -0.5], ['s1', 's2', 's3'])
+
+        with self.assertRaisesRegex(ValueError, 'changed'):
+            extend_distance_matrix(old, md)
+
+    def test_old_ids_missing(self):
+        old = distance_matrix(self.column([1.0, 4.0], ['s1', 's2']))
+
+        with self.assertRaisesRegex(ValueError, 'missing from.*s2'):
+            extend_distance_matrix(old, self.column([1.0, 3.0],
+                                                    ['s1', 's3']))
+
+
+class BatchDistanceMatrixTests(unittest.TestCase):
+    def setUp(self):
+        state = np.random.RandomState(0)
+        self.df = pd.DataFrame(
+            {'ph': state.normal(size=30), 'depth': state.normal(size=30),
+             'site': state.choice(['a', 'b'], size=30)},
+            index=pd.Index(['s%d' % i for i in range(30)], name='id'))
+        self.md = qiime2.Metadata(self.df)
+
+    def test_all_numeric_columns(self):
+        obs = batch_distance_matrix(self.md)
+
+        self.assertEqual(sorted(obs), ['depth', 'ph'])
+        for column, dm in obs.items():
+            self.assertEqual(dm, distance_matrix(self.md.get_column(column)))
+
+    def test_selected_columns(self):
+        obs = batch_distance_matrix(self.md, columns=['ph'], n_jobs=2)
+
+        self.assertEqual(list(obs), ['ph'])
+        self.assertEqual(obs['ph'], distance_matrix(self.md.get_column('ph')))
+
+    def test_written_in_turn(self):
+        obs = batch_distance_matrix(self.md)
+        written = {}
+        for column, dm in obs.items():
+            fh = io.StringIO()
+            dm.write(fh)
+            written[column] = fh.getvalue()
+
+        for column, text in written.items():
+            fh = io.StringIO()
+            distance_matrix(self.md.get_column(column)).write(fh)
+            self.assertEqual(text, fh.getvalue())
+
+    def test_multiple_blocks(self):
+        exp = {column: scipy.spatial.distance.squareform(
+                   scipy.spatial.distance.pdist(self.df[[column]]))
+               for column in ('ph', 'depth')}
+
+        # Blocks of 4 rows, so every matrix is read in several blocks.
+        with unittest.mock.patch('q2_metadata._distance._BLOCK_ELEMENTS',
+                                 4 * 30):
+            obs = batch_distance_matrix(self.md)
+        ph, depth = obs['ph'], obs['depth']
+
+        np.testing.assert_array_equal(ph.redundant_form(), exp['ph'])
+        blocks = depth.iter_row_blocks()
+        start, first = next(blocks)
+        self.assertEqual(ph.dtype, np.float64)
+        np.testing.assert_array_equal(first, exp['depth'][:4])
+        for (start, rows), (_, other) in zip(blocks, ph.iter_row_blocks()):
+            np.testing.assert_array_equal(
+                rows, exp['depth'][start:start + len(rows)])
+        np.testing.assert_array_equal(depth.redundant_form(), exp['depth'])
+
+    def test_extract(self):
+        obs = extract_distance_matrix(batch_distance_matrix(self.md),
+                                      'depth')
+
+        self.assertEqual(obs, distance_matrix(self.md.get_column('depth')))
+
+    def test_extract_unknown_column(self):
+        with self.assertRaisesRegex(ValueError, "'site'.*ph, depth"):
+            extract_distance_matrix(batch_distance_matrix(self.md), 'site')
+
+    def test_matrices_read_on_demand(self):
+        dm = distance_matrix(self.md.get_column('ph'))
+        read = unittest.mock.Mock(return_value=dm)
+        unused = unittest.mock.Mock()
+        matrices = DistanceMatrices([('ph', read), ('depth', unused)])
+
+        self.assertEqual(list(matrices), ['ph', 'depth'])
+        self.assertIs(extract_distance_matrix(matrices, 'ph'), dm)
+        self.assertIs(matrices['ph'], dm)
+        read.assert_called_once_with()
+        unused.assert_not_called()
+
+    def test_not_numeric(self):
+        with self.assertRaisesRegex(ValueError, 'Not numeric.*site'):
+            batch_distance_matrix(self.md, columns=['ph', 'site'])
+
+    def test_missing_values(self):
+        self.df.loc['s2', 'depth'] = np.nan
+
+        with self.assertRaisesRegex(ValueError, 'column\\(s\\) depth'):
+            batch_distance_matrix(qiime2.Metadata(self.df))
+
+
+class GeographicDistanceMatrixTests(unittest.TestCase):
+    def columns(self, lat, lon, ids=None):
+        index = pd.Index(ids or ['s%d' % i for i in range(len(lat))],
+                         name='id')
+        return (qiime2.NumericMetadataColumn(
+                    pd.Series(lat, name='latitude', index=index)),
+                qiime2.NumericMetadataColumn(
+                    pd.Series(lon, name='longitude', index=index)))
+
+    def test_known_distances(self):
+        # San Diego, Paris, and the antipode of Paris.
+        lat, lon = self.columns([32.7157, 48.8566, -48.8566],
+                                [-117.1611, 2.3522, -177.6478])
+
+        obs = geographic_distance_matrix(lat, lon).redundant_form()
+
+        self.assertAlmostEqual(obs[0, 1], 9155.0, delta=20)
+        self.assertAlmostEqual(obs[1, 2], np.pi * 6371.0088, places=6)
+        np.testing.assert_array_equal(np.diag(obs), 0)
+
+    def test_matches_direct_formula(self):
+        state = np.random.RandomState(0)
+        lat_values = state.uniform(-90, 90, size=40)
+        lon_values = state.uniform(-180, 180, size=40)
+        lat, lon = self.columns(lat_values, lon_values)
+        phi, lam = np.radians(lat_values), np.radians(lon_values)
+
+        def haversine(u, v):
+            a = (np.sin((v[0] - u[0]) / 2) ** 2 +
+                 np.cos(u[0]) * np.cos(v[0]) * np.sin((v[1] - u[1]) / 2) ** 2)
+            return 2 * 6371.0088 * np.arcsin(np.sqrt(a))
+
+        exp = scipy.spatial.distance.pdist(np.column_stack([phi, lam]),
+                                           haversine)
+        obs = geographic_distance_matrix(lat, lon)
+
+        np.testing.assert_allclose(obs.condensed_form(), exp, rtol=1e-12)
+        for kwargs in ({'n_jobs': 3}, {'block_size': 7},
+                       {'block_size': 7, 'n_jobs': 3}):
+            np.testing.assert_array_equal(
+                geographic_distance_matrix(lat, lon,
+                                           **kwargs).condensed_form(),
+                obs.condensed_form())
+        streamed = geographic_distance_matrix(lat, lon, block_size=7)
+        np.testing.assert_array_equal(streamed.redundant_form(),
+                                      streamed.redundant_form().T)
+
+    def test_columns_aligned_by_id(self):
+        lat, _ = self.columns([10.0, 20.0], [0.0, 0.0], ['a', 'b'])
+        _, lon = self.columns([0.0, 0.0], [30.0, 40.0], ['b', 'a'])
+
+        obs = geographic_distance_matrix(lat, lon)
+        exp = geographic_distance_matrix(
+            *self.columns([10.0, 20.0], [40.0, 30.0], ['a', 'b']))
+
+        self.assertEqual(obs, exp)
+
+    def test_different_ids(self):
+        lat, _ = self.columns([10.0, 20.0], [0.0, 0.0], ['a', 'b'])
+        _, lon = self.columns([0.0, 0.0], [30.0, 40.0], ['a', 'c'])
+
+        with self.assertRaisesRegex(ValueError, 'same IDs'):
+            geographic_distance_matrix(lat, lon)
+
+    def test_out_of_range(self):
+        with self.assertRaisesRegex(ValueError, 'Latitudes'):
+            geographic_distance_matrix(*self.columns([91.0], [0.0]))
+
+    def test_missing_values(self):
+        lat, lon = self.columns([1.0, np.nan], [0.0, 0.0])
+
+        with self.assertRaisesRegex(ValueError, "'latitude'.*s1"):
+            geographic_distance_matrix(lat, lon)
+
+
+class CondensedDistanceMatrixTests(unittest.TestCase):
+    def setUp(self):
+        self.ids = ['a', 'b', 'c', 'd']
+        self.square = np.array([[0.0, 1.0, 2.0, 3.0],
+                                [1.0, 0.0, 4.0, 5.0],
+                                [2.0, 4.0, 0.0, 6.0],
+                                [3.0, 5.0, 6.0, 0.0]])
+        self.dm = CondensedDistanceMatrix([1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                                          ids=self.ids)
+
+    def test_shape(self):
+        self.assertEqual(self.dm.shape, (4, 4))
+        self.assertEqual(self.dm.ids, ('a', 'b', 'c', 'd'))
+        self.assertEqual(len(self.dm), 4)
+
+    def test_rows(self):
+        for i, exp in enumerate(self.square):
+            np.testing.assert_array_equal(self.dm.row(i), exp)
+
+    def test_redundant_form(self):
+        np.testing.assert_array_equal(self.dm.redundant_form(), self.square)
+
+    def test_write_matches_skbio(self):
+        exp = io.StringIO()
+        skbio.DistanceMatrix(self.square, ids=self.ids).write(exp)
+        obs = io.StringIO()
+        self.dm.write(obs)
+
+        self.assertEqual(obs.getvalue(), exp.getvalue())
+
+    def test_read_round_trip(self):
+        fh = io.StringIO()
+        self.dm.write(fh)
+        fh.seek(0)
+
+        self.assertEqual(CondensedDistanceMatrix.read(fh), self.dm)
+
+    def test_read_skbio_output(self):
+        fh = io.StringIO()
+        skbio.DistanceMatrix(self.square, ids=self.ids).write(fh)
+        fh.seek(0)
+
+        self.assertEqual(CondensedDistanceMatrix.read(fh), self.dm)
+
+    def test_read_malformed(self):
+        fh = io.StringIO('\ta\tb\na\t0.0\t1.0\nc\t1.0\t0.0\n')
+
+        with self.assertRaisesRegex(ValueError, 'Row 2.*\'b\''):
+            CondensedDistanceMatrix.read(fh)
+
+    def test_write_one_sample(self):
+        obs = io.StringIO()
+        CondensedDistanceMatrix([], ids=['a']).write(obs)
+
+        self.assertEqual(obs.getvalue(), '\ta\na\t0.0\n')
+
+    def test_skbio_accessors(self):
+        exp = skbio.DistanceMatrix(self.square, ids=self.ids)
+
+        self.assertEqual(exp, self.dm)
+        self.assertEqual(self.dm, exp)
+        self.assertNotEqual(self.dm, skbio.DistanceMatrix(
+            self.square, ids=['a', 'b', 'd', 'c']))
+        np.testing.assert_array_equal(self.dm.data, exp.data)
+        np.testing.assert_array_equal(self.dm['c'], exp['c'])
+        self.assertEqual(self.dm['d', 'b'], exp['d', 'b'])
+        np.testing.assert_array_equal(self.dm[1:3], exp[1:3])
+        self.assertEqual(self.dm.index('c'), 2)
+        pd.testing.assert_frame_equal(self.dm.to_data_frame(),
+                                      exp.to_data_frame())
+
+    def test_filter(self):
+        exp = skbio.DistanceMatrix(self.square, ids=self.ids)
+
+        obs = self.dm.filter(['d', 'b', 'a'])
+        self.assertIsInstance(obs, CondensedDistanceMatrix)
+        self.assertEqual(obs, exp.filter(['d', 'b', 'a']))
+        self.assertEqual(self.dm.filter(['c', 'x', 'a'], strict=False),
+                         exp.filter(['c', 'x', 'a'], strict=False))
+        with self.assertRaises(skbio.stats.distance.MissingIDError):
+            self.dm.filter(['a', 'x'])
+
+    def test_filter_lazy_quantized(self):
+        md = qiime2.NumericMetadataColumn(pd.Series(
+            [1.0, 5.0, 2.5, 9.0], name='number',
+            index=pd.Index(self.ids, name='id')))
+        exp = distance_matrix(md, precision='uint16')
+
+        obs = distance_matrix(md, block_size=3, precision='uint16')
+        self.assertEqual(obs.filter(['c', 'a', 'd']),
+                         exp.filter(['c', 'a', 'd']))
+        self.assertEqual(obs.filter(['c', 'a', 'd']).dtype, np.uint16)
+
+    def test_wrong_length(self):
+        with self.assertRaisesRegex(ValueError, 'n \\* \\(n - 1\\) / 2'):
+            CondensedDistanceMatrix([1.0, 2.0], ids=['a', 'b', 'c'])
+
+    def test_write_reports_progress(self):
+        progress = _Throughput('rows', interval=0.0, stream=io.StringIO())
+        progress.update(10)
+        progress.finish()
+
+        self.assertRegex(progress.stream.getvalue(),
+                         r'^rows: 10 written \(\d+/s\)\n')
+
+    def test_duplicate_ids(self):
+        with self.assertRaisesRegex(ValueError, 'unique'):
+            CondensedDistanceMatrix([1.0], ids=['a', 'a'])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,243 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+import pandas as pd
+import qiime2
+
+from q2_metadata import (neighbor_graph, within_group_distances,
+                         distance_summary, distance_matrix)
+
+
+class NeighborGraphTests(unittest.TestCase):
+    def setUp(self):
+        self.md = qiime2.NumericMetadataColumn(
+            pd.Series([5.0, 1.0, 2.5, 10.0, 2.0], name='number',
+                      index=pd.Index(['a', 'b', 'c', 'd', 'e'], name='id'))
+        )
+
+    def brute_force(self, values, select):
+        ids = list(values.index)
+        rows = []
+        for i in ids:
+            dist = (values - values[i]).abs().drop(i)
+            for j in select(dist.sort_values(kind='stable')):
+                rows.append((i, j, dist[j]))
+        return pd.DataFrame(rows, columns=['id1', 'id2', 'distance'])
+
+    def test_knn(self):
+        obs = neighbor_graph(self.md, k=2)
+        exp = pd.DataFrame(
+            [['a', 'c', 2.5], ['a', 'e', 3.0],
+             ['b', 'e', 1.0], ['b', 'c', 1.5],
+             ['c', 'e', 0.5], ['c', 'b', 1.5],
+             ['d', 'a', 5.0], ['d', 'c', 7.5],
+             ['e', 'c', 0.5], ['e', 'b', 1.0]],
+            columns=['id1', 'id2', 'distance'])
+
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_radius(self):
+        obs = neighbor_graph(self.md, radius=1.0)
+        exp = pd.DataFrame(
+            [['b', 'e', 1.0], ['c', 'e', 0.5],
+             ['e', 'c', 0.5], ['e', 'b', 1.0]],
+            columns=['id1', 'id2', 'distance'])
+
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_radius_empty(self):
+        obs = neighbor_graph(self.md, radius=0.1)
+
+        self.assertEqual(list(obs.columns), ['id1', 'id2', 'distance'])
+        self.assertEqual(len(obs), 0)
+
+    def test_matches_brute_force(self):
+        state = np.random.RandomState(0)
+        values = pd.Series(np.round(state.normal(size=200), 1),
+                           index=pd.Index(['s%d' % i for i in range(200)],
+                                          name='id'))
+        md = qiime2.NumericMetadataColumn(values.rename('number'))
+
+        obs = neighbor_graph(md, radius=0.2)
+        exp = self.brute_force(values, lambda d: d.index[d <= 0.2])
+        pd.testing.assert_frame_equal(
+            obs.sort_values(['id1', 'id2']).reset_index(drop=True),
+            exp.sort_values(['id1', 'id2']).reset_index(drop=True))
+
+        # With ties the k-th neighbour is ambiguous, so only compare the
+        # distances each ID ends up with.
+        obs = neighbor_graph(md, k=5)
+        exp = self.brute_force(values, lambda d: d.index[:5])
+        np.testing.assert_array_equal(
+            obs.groupby('id1')['distance'].apply(sorted).sort_index(),
+            exp.groupby('id1')['distance'].apply(sorted).sort_index())
+
+    def test_k_or_radius(self):
+        with self.assertRaisesRegex(ValueError, 'Exactly one'):
+            neighbor_graph(self.md)
+        with self.assertRaisesRegex(ValueError, 'Exactly one'):
+            neighbor_graph(self.md, k=1, radius=1.0)
+
+    def test_k_too_large(self):
+        with self.assertRaisesRegex(ValueError, 'minus one'):
+            neighbor_graph(self.md, k=5)
+
+    def test_missing_values(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.0, np.nan], name='number',
+                      index=pd.Index(['a', 'b'], name='id'))
+        )
+
+        with self.assertRaisesRegex(ValueError, 'missing values: b'):
+            neighbor_graph(md, k=1)
+
+
+class WithinGroupDistancesTests(unittest.TestCase):
+    def setUp(self):
+        index = pd.Index(['a', 'b', 'c', 'd', 'e'], name='id')
+        self.md = qiime2.NumericMetadataColumn(
+            pd.Series([5.0, 1.0, 2.5, 10.0, 2.0], name='number',
+                      index=index))
+        self.groups = qiime2.CategoricalMetadataColumn(
+            pd.Series(['x', 'y', 'x', 'z', 'x'], name='subject',
+                      index=index))
+
+    def test_within_groups(self):
+        obs = within_group_distances(self.md, self.groups)
+        exp = pd.DataFrame(
+            [['a', 'c', 2.5], ['a', 'e', 3.0],
+             ['c', 'e', 0.5], ['c', 'a', 2.5],
+             ['e', 'c', 0.5], ['e', 'a', 3.0]],
+            columns=['id1', 'id2', 'distance'])
+
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_matches_full_matrix(self):
+        state = np.random.RandomState(0)
+        index = pd.Index(['s%d' % i for i in range(90)], name='id')
+        values = pd.Series(state.normal(size=90), index=index)
+        groups = pd.Series(state.choice(['g1', 'g2', 'g3', 'g4'], size=90),
+                           index=index)
+        md = qiime2.NumericMetadataColumn(values.rename('number'))
+        grouping = qiime2.CategoricalMetadataColumn(groups.rename('group'))
+
+        obs = within_group_distances(md, grouping, n_jobs=3)
+
+        self.assertEqual(len(obs),
+                         sum(g * (g - 1) for g in groups.value_counts()))
+        self.assertTrue(
+            (groups[obs['id1']].values == groups[obs['id2']].values).all())
+        np.testing.assert_array_equal(
+            obs['distance'].values,
+            np.abs(values[obs['id1']].values - values[obs['id2']].values))
+        pd.testing.assert_frame_equal(obs,
+                                      within_group_distances(md, grouping))
+
+    def test_extra_group_ids_ignored(self):
+        groups = qiime2.CategoricalMetadataColumn(
+            pd.Series(['x', 'y', 'x', 'z', 'x', 'x'], name='subject',
+                      index=pd.Index(['a', 'b', 'c', 'd', 'e', 'f'],
+                                     name='id')))
+
+        pd.testing.assert_frame_equal(
+            within_group_distances(self.md, groups),
+            within_group_distances(self.md, self.groups))
+
+    def test_ids_without_group(self):
+        groups = qiime2.CategoricalMetadataColumn(
+            pd.Series(['x', np.nan, 'x'], name='subject',
+                      index=pd.Index(['a', 'b', 'c'], name='id')))
+
+        with self.assertRaisesRegex(ValueError, 'without a group: b, d, e'):
+            within_group_distances(self.md, groups)
+
+
+class DistanceSummaryTests(unittest.TestCase):
+    def setUp(self):
+        self.md = qiime2.NumericMetadataColumn(
+            pd.Series([5.0, 1.0, 2.5, 10.0, 2.0], name='number',
+                      index=pd.Index(['a', 'b', 'c', 'd', 'e'], name='id')))
+
+    def test_summary(self):
+        obs = distance_summary(self.md, delta=1.0).to_dataframe()
+
+        exp = pd.DataFrame(
+            {'mean_distance': [14.5 / 4, 15.5 / 4, 12 / 4, 29.5 / 4, 12.5 / 4],
+             'ids_within_delta': [0.0, 1.0, 1.0, 0.0, 2.0]},
+            index=pd.Index(['a', 'b', 'c', 'd', 'e'], name='id'),
+            columns=['mean_distance', 'ids_within_delta'])
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_matches_distance_matrix(self):
+        state = np.random.RandomState(0)
+        values = np.round(state.normal(1000, 10, size=200), 1)
+        values[:20] = values[20:40]
+        md = qiime2.NumericMetadataColumn(
+            pd.Series(values, name='number',
+                      index=pd.Index(['s%d' % i for i in range(200)],
+                                     name='id')))
+        dm = distance_matrix(md).redundant_form()
+
+        obs = distance_summary(md, delta=2.5).to_dataframe()
+
+        np.testing.assert_allclose(obs['mean_distance'],
+                                   dm.sum(axis=1) / 199, rtol=1e-12)
+        np.testing.assert_array_equal(obs['ids_within_delta'],
+                                      (dm <= 2.5).sum(axis=1) - 1)
+
+    def test_within_delta_matches_brute_force(self):
+        # Grid values put many distances exactly at delta, where
+        # values[i] + delta and values[j] - values[i] round differently.
+        state = np.random.RandomState(0)
+        for scale, delta in ((1, 0.3), (10, 0.7), (1000, 0.1)):
+            values = np.round(state.normal(scale=scale, size=40), 1)
+            md = qiime2.NumericMetadataColumn(
+                pd.Series(values, name='number',
+                          index=pd.Index(['s%d' % i for i in range(40)],
+                                         name='id')))
+            diffs = np.abs(np.subtract.outer(values, values))
+
+            obs = distance_summary(md, delta=delta).to_dataframe()
+
+            np.testing.assert_array_equal(obs['ids_within_delta'],
+                                          (diffs <= delta).sum(axis=1) - 1)
+
+    def test_zero_delta_counts_ties(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.0, 1.0, 2.0], name='number',
+                      index=pd.Index(['a', 'b', 'c'], name='id')))
+
+        obs = distance_summary(md, delta=0.0).to_dataframe()
+
+        np.testing.assert_array_equal(obs['ids_within_delta'], [1, 1, 0])
+
+    def test_negative_delta(self):
+        with self.assertRaisesRegex(ValueError, 'negative'):
+            distance_summary(self.md, delta=-1.0)
+
+    def test_single_id(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.0], name='number', index=pd.Index(['a'], name='id')))
+
+        with self.assertRaisesRegex(ValueError, 'two IDs'):
+            distance_summary(md, delta=1.0)
+
+    def test_missing_values(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series([1.0, np.nan], name='number',
+                      index=pd.Index(['a', 'b'], name='id')))
+
+        with self.assertRaisesRegex(ValueError, 'missing values: b'):
+            distance_summary(md, delta=1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import scipy.spatial
+import skbio
+import qiime2
+
+from q2_metadata import mantel, distance_matrix
+from q2_metadata._distance import CondensedDistanceMatrix
+from q2_metadata._mantel import _mantel_test
+
+
+class MantelTests(unittest.TestCase):
+    def setUp(self):
+        state = np.random.RandomState(0)
+        self.ids = ['s%d' % i for i in range(25)]
+        self.values = np.round(state.normal(size=25), 2)
+        points = state.normal(size=(25, 3))
+        points[:, 0] += self.values
+        self.dm = CondensedDistanceMatrix(
+            scipy.spatial.distance.pdist(points), ids=self.ids)
+        self.md = qiime2.NumericMetadataColumn(
+            pd.Series(self.values, name='number',
+                      index=pd.Index(self.ids, name='id')))
+
+    def test_matches_two_step_pipeline(self):
+        # distance_matrix followed by skbio's Mantel test, as q2-diversity
+        # runs it.
+        x = distance_matrix(self.md).to_skbio()
+        y = self.dm.to_skbio()
+        for method in ('pearson', 'spearman'):
+            for seed in (1, 42):
+                exp = skbio.stats.distance.mantel(
+                    x, y, method=method, permutations=99, seed=seed)
+                obs = _mantel_test(self.dm, self.values, self.ids,
+                                   method=method, permutations=99, seed=seed)
+
+                self.assertAlmostEqual(obs[0], exp[0])
+                self.assertAlmostEqual(obs[1], exp[1])
+                self.assertEqual(obs[2], exp[2])
+
+    def test_n_jobs(self):
+        obs = _mantel_test(self.dm, self.values, self.ids, 'pearson',
+                           permutations=50, seed=1, n_jobs=3)
+        exp = _mantel_test(self.dm, self.values, self.ids, 'pearson',
+                           permutations=50, seed=1)
+
+        self.assertEqual(obs, exp)
+
+    def test_reordered_distance_matrix(self):
+        order = np.random.RandomState(3).permutation(25)
+        square = self.dm.redundant_form()[order][:, order]
+        shuffled = CondensedDistanceMatrix(
+            scipy.spatial.distance.squareform(square),
+            ids=[self.ids[i] for i in order])
+
+        for method in ('pearson', 'spearman'):
+            self.assertAlmostEqual(
+                _mantel_test(shuffled, self.values, self.ids, method, 0)[0],
+                _mantel_test(self.dm, self.values, self.ids, method, 0)[0])
+
+    def test_no_permutations(self):
+        stat, p_value, n = _mantel_test(self.dm, self.values, self.ids,
+                                        permutations=0)
+
+        self.assertTrue(np.isnan(p_value))
+        self.assertEqual(n, 25)
+
+    def test_too_few_ids(self):
+        with self.assertRaisesRegex(ValueError, 'At least 3'):
+            _mantel_test(self.dm, self.values[:2], self.ids[:2])
+
+    def test_visualizer(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            mantel(output_dir, self.dm, self.md, permutations=9, seed=0)
+
+            self.assertTrue(os.path.exists(
+                os.path.join(output_dir, 'index.html')))
+            results = pd.read_csv(os.path.join(output_dir, 'mantel.tsv'),
+                                  sep='\t', header=None, index_col=0)[1]
+            self.assertEqual(results['Method'], 'Spearman')
+            self.assertEqual(results['Sample size'], '25')
+
+    def test_mismatched_ids(self):
+        md = qiime2.NumericMetadataColumn(
+            pd.Series(self.values[:20], name='number',
+                      index=pd.Index(self.ids[:20], name='id')))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with self.assertRaisesRegex(ValueError, 'intersect_ids'):
+                mantel(output_dir, self.dm, md)
+
+            mantel(output_dir, self.dm, md, permutations=0,
+                   intersect_ids=True)
+            results = pd.read_csv(os.path.join(output_dir, 'mantel.tsv'),
+                                  sep='\t', header=None, index_col=0)[1]
+            self.assertEqual(results['Sample size'], '20')
+
+
+if __name__ == "__main__":
+    unittest.main()
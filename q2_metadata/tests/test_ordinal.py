@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+import numpy as np
+import qiime2
+
+from q2_metadata import ordinal_distance_matrix, distance_matrix
+
+
+def _column(values, name='fermented_plant_frequency'):
+    index = pd.Index(['s%d' % i for i in range(len(values))], name='id')
+    return qiime2.CategoricalMetadataColumn(
+        pd.Series(values, name=name, index=index))
+
+
+class OrdinalDistanceMatrixTests(unittest.TestCase):
+    def test_bundled_rule(self):
+        md = _column(['Never', 'Daily', 'Rarely (less than once/week)',
+                      'Regularly (3-5 times/week)'])
+
+        obs = ordinal_distance_matrix(md)
+
+        self.assertEqual(obs.ids, ('s0', 's1', 's2', 's3'))
+        np.testing.assert_array_equal(obs.redundant_form(),
+                                      [[0, 4, 1, 3],
+                                       [4, 0, 3, 1],
+                                       [1, 3, 0, 2],
+                                       [3, 1, 2, 0]])
+
+    def test_matches_distance_matrix(self):
+        levels = ['low', 'mid', 'high']
+        codes = np.random.RandomState(0).randint(0, 3, size=50)
+        md = _column([levels[c] for c in codes], name='level')
+        exp = distance_matrix(qiime2.NumericMetadataColumn(
+            pd.Series(codes.astype(float), name='level',
+                      index=md.to_series().index)))
+
+        with tempfile.TemporaryDirectory() as rules_dir:
+            with open(os.path.join(rules_dir, 'level.yml'), 'w') as handle:
+                handle.write('expected:\n- low\n- mid\n- high\n')
+            for kwargs in ({}, {'n_jobs': 2}, {'block_size': 7}):
+                obs = ordinal_distance_matrix(md, rules_dir=rules_dir,
+                                              **kwargs)
+                np.testing.assert_array_equal(obs.condensed_form(),
+                                              exp.condensed_form())
+
+    def test_rule_blank_and_missing_values(self):
+        md = _column(['Never', 'Not provided', 'Daily', 'Not applicable'])
+
+        with self.assertRaisesRegex(ValueError, 'missing values: s1, s3'):
+            ordinal_distance_matrix(md)
+
+    def test_unexpected_value(self):
+        md = _column(['Never', 'Sometimes', 'Daily'])
+
+        with self.assertRaisesRegex(ValueError, "expected.*'Sometimes'"):
+            ordinal_distance_matrix(md)
+
+    def test_rule_without_expected_values(self):
+        md = _column(['2015', '2016'], name='collection_timestamp')
+
+        with self.assertRaisesRegex(ValueError, 'ordered list'):
+            ordinal_distance_matrix(md)
+
+    def test_no_rule(self):
+        md = _column(['a', 'b'], name='no_such_variable')
+
+        with self.assertRaisesRegex(ValueError, 'No yaml rules'):
+            ordinal_distance_matrix(md)
+
+
+if __name__ == '__main__':
+    unittest.main()
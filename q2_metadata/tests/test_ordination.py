@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+import pandas as pd
+import scipy.spatial
+import skbio
+import qiime2
+from skbio.stats.ordination import pcoa as skbio_pcoa
+
+from q2_metadata import pcoa
+
+
+class PCoATests(unittest.TestCase):
+    def setUp(self):
+        state = np.random.RandomState(0)
+        self.df = pd.DataFrame(
+            {'ph': state.uniform(4, 9, size=40),
+             'temperature': state.normal(15, 5, size=40),
+             'depth': state.exponential(10, size=40),
+             'site': state.choice(['a', 'b'], size=40)},
+            index=pd.Index(['s%d' % i for i in range(40)], name='id'))
+        self.md = qiime2.Metadata(self.df)
+
+    def expected(self, X):
+        dm = skbio.DistanceMatrix(scipy.spatial.distance.pdist(X),
+                                  ids=self.df.index)
+        return skbio_pcoa(dm, number_of_dimensions=X.shape[1])
+
+    def assertOrdinationsClose(self, obs, exp):
+        n_axes = len(obs.eigvals)
+        np.testing.assert_allclose(obs.eigvals.values,
+                                   exp.eigvals.values[:n_axes], atol=1e-8)
+        np.testing.assert_allclose(obs.proportion_explained.values,
+                                   exp.proportion_explained.values[:n_axes],
+                                   atol=1e-8)
+        # Axes are only defined up to their sign.
+        np.testing.assert_allclose(np.abs(obs.samples.values),
+                                   np.abs(exp.samples.values[:, :n_axes]),
+                                   atol=1e-8)
+        self.assertEqual(list(obs.samples.index), list(self.df.index))
+
+    def test_matches_distance_matrix_pcoa(self):
+        obs = pcoa(self.md)
+        exp = self.expected(self.df[['ph', 'temperature', 'depth']].values)
+
+        self.assertEqual(list(obs.eigvals.index), ['PC1', 'PC2', 'PC3'])
+        self.assertOrdinationsClose(obs, exp)
+
+    def test_scaling(self):
+        X = self.df[['ph', 'temperature', 'depth']]
+        X = (X - X.mean()) / X.std(ddof=0)
+
+        obs = pcoa(self.md, scaling='z-score')
+
+        self.assertOrdinationsClose(obs, self.expected(X.values))
+
+    def test_number_of_dimensions(self):
+        obs = pcoa(self.md, number_of_dimensions=2)
+        full = pcoa(self.md)
+
+        self.assertEqual(list(obs.samples.columns), ['PC1', 'PC2'])
+        pd.testing.assert_frame_equal(obs.samples,
+                                      full.samples[['PC1', 'PC2']])
+        pd.testing.assert_series_equal(
+            obs.proportion_explained,
+            full.proportion_explained[['PC1', 'PC2']])
+
+    def test_too_many_dimensions(self):
+        with self.assertRaisesRegex(ValueError, 'at most 3'):
+            pcoa(self.md, number_of_dimensions=4)
+
+    def test_deterministic_signs(self):
+        obs = pcoa(self.md)
+
+        for axis in obs.samples:
+            coordinates = obs.samples[axis]
+            self.assertGreater(coordinates[coordinates.abs().idxmax()], 0)
+
+    def test_no_numeric_columns(self):
+        md = qiime2.Metadata(self.df[['site']])
+
+        with self.assertRaisesRegex(ValueError, 'any numeric columns'):
+            pcoa(md)
+
+    def test_missing_values(self):
+        self.df.loc['s7', 'depth'] = np.nan
+
+        with self.assertRaisesRegex(ValueError, 'missing values: s7'):
+            pcoa(qiime2.Metadata(self.df))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,16 +6,53 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import base64
+import gzip
+import json
 import os
+import unittest.mock
 from unittest import TestCase, main
 import tempfile
 
+import numpy as np
 import pandas as pd
 import qiime2
 
 from q2_metadata import tabulate
 
 
+def _manifest(output_dir):
+    with open(os.path.join(output_dir, 'index.html')) as fh:
+        viz = fh.read()
+    start = viz.index('<script id="manifest" type="application/json">')
+    start = viz.index('>', start) + 1
+    return json.loads(viz[start:viz.index('</script>', start)])
+
+
+def _decode_column(column):
+    if 'ids' in column:
+        return column['ids']
+    if 'numbers' in column:
+        numbers = np.frombuffer(base64.b64decode(column['numbers']), '<f8')
+        return [None if np.isnan(v) else v for v in numbers]
+    codes = np.frombuffer(base64.b64decode(column['codes']),
+                          '<u%d' % column['width'])
+    return [column['values'][c] for c in codes]
+
+
+def _shard_rows(output_dir):
+    rows = []
+    for shard in _manifest(output_dir)['shards']:
+        decoded = []
+        for path in shard['paths']:
+            with gzip.open(os.path.join(output_dir, path), 'rt') as fh:
+                columns = json.load(fh)['columns']
+            decoded.extend(_decode_column(column) for column in columns)
+        rows.extend([list(row) for row in zip(*decoded)])
+        assert all(len(c) == shard['rows'] for c in decoded)
+    return rows
+
+
 class TabulateTests(TestCase):
     def test_valid_metadata(self):
         index = pd.Index(['sample1', 'sample2', 'sample3'], name='id')
@@ -33,8 +70,8 @@ class TabulateTests(TestCase):
             self.assertTrue('pageLength: 100' in viz)
             self.assertTrue('"columns":[["id",""],["foo","categorical"]]'
                             in viz)
-            self.assertTrue(all(i in viz for i in index))
-            self.assertTrue(all(val in viz for val in data))
+            rows = _shard_rows(output_dir)
+            self.assertEqual(rows, [[i, v] for i, v in zip(index, data)])
 
     def test_valid_metadata_many_columns(self):
         index = pd.Index(['sample1', 'sample2', 'sample3'], name='id')
@@ -55,8 +92,8 @@ class TabulateTests(TestCase):
             self.assertTrue('"columns":[["id",""],["foo","categorical"],'
                             '["bar","categorical"],["baz","categorical"]]'
                             in viz)
-            self.assertTrue(all(i in viz for i in index))
-            self.assertTrue(all(v in viz for row in data for v in row))
+            rows = _shard_rows(output_dir)
+            self.assertEqual(rows, [[i] + r for i, r in zip(index, data)])
 
     def test_multiple_dtypes(self):
         index = pd.Index(['sample1', 'sample2', 'sample3'], name='id')
@@ -73,8 +110,8 @@ class TabulateTests(TestCase):
             self.assertTrue('pageLength: 100' in viz)
             self.assertTrue('"columns":[["id",""],["foo","numeric"],'
                             '["bar","categorical"]]' in viz)
-            self.assertTrue(all(i in viz for i in index))
-            self.assertTrue(all(str(v) in viz for row in data for v in row))
+            rows = _shard_rows(output_dir)
+            self.assertEqual(rows, [[i] + r for i, r in zip(index, data)])
 
     def test_pagination(self):
         index = pd.Index(['sample1', 'sample2', 'sample3'], name='id')
@@ -90,6 +127,22 @@ class TabulateTests(TestCase):
 
             self.assertTrue('pageLength: 2' in viz)
 
+    def test_virtual_scrolling(self):
+        index = pd.Index(['sample1', 'sample2', 'sample3'], name='id')
+        md = qiime2.Metadata(pd.DataFrame({'value': [1.0, 2.0, 3.0]},
+                                          index=index))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            tabulate(output_dir, md)
+            with open(os.path.join(output_dir, 'index.html')) as fh:
+                viz = fh.read()
+
+            self.assertIn('deferRender: true', viz)
+            self.assertIn('scroller: {', viz)
+            self.assertIn('<script id="table-worker" type="text/js-worker">',
+                          viz)
+            self.assertIn('id="column-picker"', viz)
+
     def test_invalid_pagination(self):
         index = pd.Index(['sample1', 'sample2', 'sample3'], name='id')
         values = ['1.0', '2.0', '3.0']
@@ -99,6 +152,162 @@ class TabulateTests(TestCase):
             with self.assertRaisesRegex(ValueError, 'less than one'):
                 tabulate(output_dir, md, -1)
 
+    def test_shards(self):
+        index = pd.Index(['s%d' % i for i in range(7)], name='id')
+        md = qiime2.Metadata(pd.DataFrame(
+            {'foo': np.arange(7) / 4,
+             'bar': ['a', None, 'c</script>', 'd', 'e', 'f', 'g\u00e9']},
+            index=index, columns=['foo', 'bar']))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with unittest.mock.patch('q2_metadata._tabulate._SHARD_ROWS', 3):
+                tabulate(output_dir, md)
+            viz = open(os.path.join(output_dir, 'index.html')).read()
+            manifest = _manifest(output_dir)
+
+            self.assertNotIn('</script>', viz.split('id="manifest"')[1]
+                             .split('</script>')[0])
+            self.assertEqual(manifest['columns'], [['id', ''],
+                                                   ['foo', 'numeric'],
+                                                   ['bar', 'categorical']])
+            self.assertEqual(manifest['rows'], 7)
+            self.assertEqual(manifest['shard_rows'], 3)
+            self.assertEqual([s['rows'] for s in manifest['shards']],
+                             [3, 3, 1])
+            self.assertEqual(sorted(os.listdir(os.path.join(output_dir,
+                                                            'data'))),
+                             ['shard-00000-000.json.gz',
+                              'shard-00001-000.json.gz',
+                              'shard-00002-000.json.gz'])
+            rows = _shard_rows(output_dir)
+            self.assertEqual(rows, [[i, f, b] for i, f, b in zip(
+                index, np.arange(7) / 4,
+                ['a', None, 'c</script>', 'd', 'e', 'f', 'g\u00e9'])])
+
+    def test_small_tables_are_inlined(self):
+        md = qiime2.Metadata(pd.DataFrame(
+            {'foo': np.arange(7) / 4},
+            index=pd.Index(['s%d' % i for i in range(7)], name='id')))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with unittest.mock.patch('q2_metadata._tabulate._SHARD_ROWS', 3):
+                tabulate(output_dir, md)
+            manifest = _manifest(output_dir)
+
+            paths = [p for shard in manifest['shards'] for p in shard['paths']]
+            self.assertEqual(sorted(manifest['inline']), paths)
+            for path in paths:
+                with open(os.path.join(output_dir, path), 'rb') as fh:
+                    self.assertEqual(
+                        base64.b64decode(manifest['inline'][path]),
+                        fh.read())
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with unittest.mock.patch(
+                    'q2_metadata._tabulate._INLINE_BYTES', 10):
+                tabulate(output_dir, md)
+
+            self.assertNotIn('inline', _manifest(output_dir))
+
+    def test_dictionary_encoding(self):
+        n = 300
+        index = pd.Index(['s%d' % i for i in range(n)], name='id')
+        md = qiime2.Metadata(pd.DataFrame(
+            {'body_product': np.array(['UBERON:feces', 'UBERON:saliva',
+                                       None])[np.arange(n) % 3],
+             'height_cm': np.where(np.arange(n) % 5, np.arange(n) * 0.1,
+                                   np.nan)},
+            index=index, columns=['body_product', 'height_cm']))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            tabulate(output_dir, md)
+            manifest = _manifest(output_dir)
+            with gzip.open(os.path.join(output_dir,
+                                        manifest['shards'][0]['paths'][0]),
+                           'rt') as fh:
+                ids, body_product, height_cm = json.load(fh)['columns']
+
+            self.assertEqual(body_product['values'],
+                             [None, 'UBERON:feces', 'UBERON:saliva'])
+            self.assertEqual(body_product['width'], 1)
+            # IDs are unique, so they are listed as they are.
+            self.assertEqual(ids, {'ids': list(index)})
+            self.assertEqual(set(height_cm), {'numbers'})
+            rows = _shard_rows(output_dir)
+            self.assertEqual(rows, [
+                [i, b, h] for i, b, h in zip(
+                    index, ['UBERON:feces', 'UBERON:saliva', None] * 100,
+                    [v if k % 5 else None
+                     for k, v in enumerate(np.arange(n) * 0.1)])])
+
+    def test_column_groups(self):
+        index = pd.Index(['s%d' % i for i in range(5)], name='id')
+        df = pd.DataFrame({'c%d' % j: np.arange(5) * j for j in range(4)},
+                          index=index)
+        df['c4'] = ['a', 'b', None, 'a', 'b']
+        md = qiime2.Metadata(df)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with unittest.mock.patch('q2_metadata._tabulate._SHARD_ROWS', 3), \
+                    unittest.mock.patch(
+                        'q2_metadata._tabulate._GROUP_COLUMNS', 2):
+                tabulate(output_dir, md)
+            manifest = _manifest(output_dir)
+
+            self.assertEqual(manifest['group_columns'], 2)
+            self.assertEqual(manifest['shards'][1]['paths'],
+                             ['data/shard-00001-000.json.gz',
+                              'data/shard-00001-001.json.gz',
+                              'data/shard-00001-002.json.gz'])
+            with gzip.open(os.path.join(output_dir, 'data',
+                                        'shard-00000-002.json.gz'),
+                           'rt') as fh:
+                columns = json.load(fh)['columns']
+            self.assertEqual([_decode_column(c) for c in columns],
+                             [[0.0, 3.0, 6.0], ['a', 'b', None]])
+            self.assertEqual(_shard_rows(output_dir), [
+                [i, 0.0, k, 2.0 * k, 3.0 * k, c] for i, k, c in zip(
+                    index, range(5), ['a', 'b', None, 'a', 'b'])])
+
+    def test_shards_are_reproducible(self):
+        index = pd.Index(['s1', 's2'], name='id')
+        md = qiime2.Metadata(pd.DataFrame({'foo': ['a', 'b']}, index=index))
+
+        shards = []
+        for _ in range(2):
+            with tempfile.TemporaryDirectory() as output_dir:
+                tabulate(output_dir, md)
+                path = os.path.join(output_dir, 'data',
+                                    'shard-00000-000.json.gz')
+                with open(path, 'rb') as fh:
+                    shards.append(fh.read())
+
+        self.assertEqual(shards[0], shards[1])
+        self.assertEqual(shards[0][:2], b'\x1f\x8b')
+
+    def test_metadata_tsv_matches_save(self):
+        index = pd.Index(['s%d' % i for i in range(7)], name='sample-id')
+        md = qiime2.Metadata(pd.DataFrame(
+            {'num': [1.0, np.nan, 1e-20, 123456789.123456789, -0.5, 42.0,
+                     1 / 3],
+             'cat': ['a', None, 'tab\there', 'quote"d', 'new\nline', '',
+                     'g\u00e9']},
+            index=index, columns=['num', 'cat']))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with unittest.mock.patch('q2_metadata._tabulate._SHARD_ROWS', 3):
+                tabulate(output_dir, md)
+            md.save(os.path.join(output_dir, 'expected.tsv'))
+
+            with open(os.path.join(output_dir, 'metadata.tsv'), 'rb') as fh:
+                obs = fh.read()
+            with open(os.path.join(output_dir, 'expected.tsv'), 'rb') as fh:
+                exp = fh.read()
+            self.assertEqual(obs, exp)
+            self.assertEqual(_manifest(output_dir)['columns'][0],
+                             ['sample-id', ''])
+            self.assertEqual(len(_shard_rows(output_dir)), 7)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017-2019, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+import pandas as pd
+import numpy as np
+import qiime2
+
+from q2_metadata import temporal_distance_matrix, distance_matrix
+from q2_metadata._temporal import _parse_timestamps
+
+
+def _column(values, cls=qiime2.CategoricalMetadataColumn):
+    index = pd.Index(['s%d' % i for i in range(len(values))], name='id')
+    return cls(pd.Series(values, name='collection_timestamp', index=index))
+
+
+class ParseTimestampsTests(unittest.TestCase):
+    def test_granularities(self):
+        values = ['2015', '2017-07', '2017-07-10', '2017-05-23 11:00',
+                  '2011-09 -09 14:30', '2017-05-23T11:00:30', '2017-07']
+
+        obs = _parse_timestamps(values)
+
+        exp = [pd.Timestamp(v).value // 10 ** 9 for v in
+               ['2015-01-01', '2017-07-01', '2017-07-10', '2017-05-23 11:00',
+                '2011-09-09 14:30', '2017-05-23 11:00:30', '2017-07-01']]
+        self.assertEqual(obs.dtype, np.int64)
+        np.testing.assert_array_equal(obs, exp)
+
+    def test_leap_day(self):
+        obs = _parse_timestamps(['2016-02-29', '2016-03-01'])
+
+        self.assertEqual(obs[1] - obs[0], 86400)
+
+    def test_invalid(self):
+        for value in ['2015-13', '2015-02-29', '2015-01-01 24:00', 'May 2015',
+                      '12/04/2015 10:27']:
+            with self.assertRaisesRegex(ValueError, 'could not be parsed'):
+                _parse_timestamps(['2015', value])
+
+
+class TemporalDistanceMatrixTests(unittest.TestCase):
+    def test_days(self):
+        md = _column(['2017-01-01', '2017-01-03', '2017-01-02 12:00'])
+
+        obs = temporal_distance_matrix(md).redundant_form()
+
+        np.testing.assert_array_equal(obs, [[0, 2, 1.5],
+                                            [2, 0, 0.5],
+                                            [1.5, 0.5, 0]])
+
+    def test_hours(self):
+        md = _column(['2017-01-01', '2017-01-03', '2017-01-02 12:00'])
+
+        obs = temporal_distance_matrix(md, units='hours').redundant_form()
+
+        np.testing.assert_array_equal(obs[0], [0, 48, 36])
+
+    def test_matches_distance_matrix(self):
+        md = _column(['2017-01-01', '2018-06-30 09:15', '2019', '2016-02'])
+        days = [(pd.Timestamp(v) - pd.Timestamp('2016-02-01')).total_seconds()
+                / 86400 for v in ['2017-01-01', '2018-06-30 09:15',
+                                  '2019-01-01', '2016-02-01']]
+        exp = distance_matrix(_column(days, qiime2.NumericMetadataColumn))
+
+        for kwargs in ({}, {'n_jobs': 2}, {'block_size': 3}):
+            obs = temporal_distance_matrix(md, **kwargs)
+            self.assertEqual(obs.ids, ('s0', 's1', 's2', 's3'))
+            np.testing.assert_array_equal(obs.condensed_form(),
+                                          exp.condensed_form())
+
+    def test_numeric_years(self):
+        md = _column([2015.0, 2017.0], qiime2.NumericMetadataColumn)
+
+        obs = temporal_distance_matrix(md)
+
+        np.testing.assert_array_equal(obs.condensed_form(), [731])
+
+    def test_numeric_fractional_years(self):
+        md = _column([2015.5, 2017.0], qiime2.NumericMetadataColumn)
+
+        with self.assertRaisesRegex(ValueError, 'whole years'):
+            temporal_distance_matrix(md)
+
+    def test_missing_values(self):
+        md = _column(['2015', np.nan])
+
+        with self.assertRaisesRegex(ValueError, 'missing.*s1'):
+            temporal_distance_matrix(md)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,6 +25,7 @@ setup(
     },
     package_data={
         'q2_metadata': ['templates/tabulate/*',
+                        'templates/mantel/*',
                         'normalization/rules/*.yml'],
     },
     zip_safe=False,